@@ -6,10 +6,13 @@ import os
 import shutil
 import subprocess
 import logging
+import multiprocessing
+import time
 from glob import glob
 from logging.handlers import RotatingFileHandler
 from functools import wraps, partial  # noqa maybe can be used on save files
-from threading import Thread, Event
+from threading import Thread, Event, RLock
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from datetime import datetime
 
 try:
@@ -19,10 +22,14 @@ try:
 except (RuntimeError, ModuleNotFoundError):
     GPIO = None  # None means that is not running on raspberry pi
     # ROOT = os.getcwd()
+if multiprocessing.parent_process() is not None:
+    GPIO = None  # Processing workers import the app as their main module, but never use pins
 
 from flask_caching import Cache
 from flask import (
     Flask,
+    Request,
+    current_app,
     render_template,
     redirect,
     url_for,
@@ -35,14 +42,28 @@ from flask import (
 from werkzeug.security import generate_password_hash, check_password_hash  # noqa
 from flask_socketio import SocketIO
 
-from scripts.converter import ExperimentCycle, ControlFile
-from scripts.stats import ResumeDataFrame, Control
-from scripts.error_handler import checker
+from scripts.error_handler import check_headers
+from scripts.ingest import IngestStream, save_upload
+from scripts.processing import (
+    control_mo2,
+    experiment_resume,
+    save_resume,
+    publish_archive,
+    calculate_blank,
+)
+from scripts.jobs import JobQueue
+from scripts.journal import MAX_EVENTS, PumpJournal
+from scripts.live import LiveExperiment
+from scripts.scheduler import PumpScheduler
+from scripts.state import SystemState
+from scripts import metrics
+from scripts.metrics import Metrics, measured
 
 from scripts.utils import (
     to_mbyte,
     delete_zip_file,
     to_js_time,
+    to_timestamp,
     check_extensions,
     SUPPORTED_FILES,
     greeting,
@@ -61,7 +82,11 @@ config = {
     "LOGS_FOLDER": f"{ROOT}/logs",
     "LOGS_MB_SIZE": 24578,
     "LOGS_BACKUP": 10,
+    "PUMP_JOURNAL": f"{ROOT}/logs/pump_events.sqlite3",
     "ZIP_FOLDER": f"{ROOT}/static/uploads/zip_files",
+    # Processes used to process uploaded files, each one holds a whole parsed recording
+    "PROCESS_WORKERS": int(os.getenv("PROCESS_WORKERS", 2)),
+    "JOB_WORKERS": 1,  # Uploads processed at the same time
 }  # UNIT: minutes
 
 # DEFINE RASPBERRY PI PINS NUMBERS AND API FUNCTIONS
@@ -71,17 +96,54 @@ if GPIO is not None:
     GPIO.setup(PUMP_GPIO, GPIO.OUT)  # GPIO Assign mode
 
 
+class StreamingRequest(Request):
+    """Request that ingests the uploaded probe files while they arrive.
+
+    Uploaded .txt files are written to disk, hashed and parsed chunk by chunk as the request
+    body is read, instead of being buffered first and parsed once saved.
+    """
+
+    def _get_file_stream(
+        self, total_content_length, content_type, filename=None, content_length=None
+    ):  # noqa
+        if not filename or not filename.lower().endswith(".txt"):
+            return super()._get_file_stream(
+                total_content_length, content_type, filename, content_length
+            )
+        stream = IngestStream(
+            f"{current_app.config['UPLOAD_FOLDER']}/incoming",
+            config_from_file()["experiment_file_config"]["DT_COL"],
+            check=check_headers,
+        )
+        self.__dict__.setdefault("ingest_streams", []).append(stream)
+        return stream
+
+    def close(self):
+        """Remove the temporary files of the uploads that weren't saved."""
+        for stream in self.__dict__.get("ingest_streams", []):
+            stream.discard()
+        super().close()
+
+
 # DEFINE APP
 app = Flask(__name__)
+app.request_class = StreamingRequest
 app.config.from_mapping(config)
 _active_threads = {}
 exit_thread = Event()
 # Setup cache
 cache = Cache(app)
-cache.set_many((("run_manual", False), ("run_auto", False), ("running", False)))
 
 # SocketIO
 socketio = SocketIO(app, async_mode=None)
+
+
+def state_changed(version, changes):
+    """Send the changed fields of the system state to the clients."""
+    socketio.emit("state", {"version": version, "changes": changes}, namespace="/resPi")
+
+
+state = SystemState(on_change=state_changed)
 # thread = None
 # thread_lock = Lock()
 # Setup logging
@@ -96,6 +158,10 @@ handler.setFormatter(logging.Formatter("%(message)s"))
 handler.setLevel(logging.WARNING)
 
 app.logger.addHandler(handler)
+# Pump events journal
+journal = PumpJournal(app.config["PUMP_JOURNAL"])
+pump_on_since = None  # Monotonic time the pump was switched on
+pump_lock = RLock()  # Each switch changes the pump and the state at once
 UNIT = 60  # 1 for seconds, 60 for minutes
 
 
@@ -130,72 +196,73 @@ def check_password(password):
 ####################
 # PUMP SETUP AND CONFIGURATION
 ####################
-def switch_on():
-    """Turn pump ON."""
-    if GPIO:
-        GPIO.output(PUMP_GPIO, GPIO.HIGH)  # on
-    cache.set("running", True)
-    run_mode = "automatic" if cache.get("run_auto") else "manual"  # only for logging
+def switch_on(loop=None, planned=None, **changes):
+    """Turn pump ON, along with any other changes of the system state.
+
+    loop, planned: automatic program loop and seconds the pump is planned to run, journaled
+        with the event.
+    """
+    global pump_on_since
+    with pump_lock:
+        if GPIO:
+            GPIO.output(PUMP_GPIO, GPIO.HIGH)  # on
+        pump_on_since = time.monotonic()
+        run_mode = "automatic" if state["run_auto"] else "manual"
+        journal.record("on", run_mode, loop, planned)
+        state.update(running=True, **changes)
     logger.warning(f"Pump is running | Mode: {run_mode}")
 
 
-def switch_off():
-    """Turn pump OFF."""
-    if GPIO:
-        GPIO.output(PUMP_GPIO, GPIO.LOW)  # off
+def switch_off(loop=None, planned=None, **changes):
+    """Turn pump OFF, along with any other changes of the system state.
 
-    cache.set_many((("cycle_ends_in", None), ("next_cycle_at", None), ("running", False)))
-    run_mode = "automatic" if cache.get("run_auto") else "manual"  # only for logging
+    The seconds the pump was actually running are journaled with the event.
+    """
+    global pump_on_since
+    with pump_lock:
+        if GPIO:
+            GPIO.output(PUMP_GPIO, GPIO.LOW)  # off
+        actual = None if pump_on_since is None else time.monotonic() - pump_on_since
+        pump_on_since = None
+        run_mode = "automatic" if state["run_auto"] else "manual"
+        journal.record("off", run_mode, loop, planned, actual)
+        state.update(
+            **{"cycle_ends_in": None, "next_cycle_at": None, **changes, "running": False}
+        )
     logger.warning(f"Pump is off |  Mode: {run_mode}")
 
 
 # PUMP CYCLE
-def pump_cycle(cycle, period):
-    """Define how long pump is ON in order to full the fish tank."""
-    # Turn on the pump
-    started = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    cache.set("total_loops", cache.get("total_loops") + 1)
-    switch_on()
-    cache.set("cycle_ends_in", to_js_time(cycle, "auto"))
-    socketio.emit(
-        "automatic_program",
-        {
-            "data": "Server generated event",
-            "running": cache.get("running"),
-            "run_auto": cache.get("running"),
-            "cycle_ends_in": cache.get("cycle_ends_in"),
-            "total_loops": cache.get("total_loops"),
-            "auto_run_since": cache.get("auto_run_since"),
-        },
-        namespace="/resPi",
-    )
-    # Wait until tank is full
-    if not exit_thread.wait(timeout=cycle):  # MINUTES
-        if cache.get("run_auto"):  # If still in current automatic program
-            # Turn off the pump
-            switch_off()
-            cache.set("next_cycle_at", to_js_time(period, "auto"))
-            socketio.emit(
-                "automatic_program",
-                {
-                    "data": "Server generated event",
-                    "running": cache.get("running"),
-                    "run_auto": True,
-                    "next_cycle_at": cache.get("next_cycle_at"),
-                },
-                namespace="/resPi",
-            )
-            ended = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            # print(f"Current automatic program: Started {str(started)} | Ended: {str(ended)}")
-            # Write information to logging file
-            print(
-                f"""Current program [{cache.get("total_loops")}]: Started {started} | Ended: {ended}"""
-            )
-            logger.warning(
-                f"""Current program [{cache.get("total_loops")}]: Started {started} | Ended: {ended}"""
-            )
-        else:  # Ignore previous. Pump is already off
-            logger.warning(f"Automatic program: Started {started} was closed forced by user")
+def pump_cycle(loop, on, scheduler):
+    """Turn the pump on to fill the fish tank during the loop flush, and off once done."""
+    on_at, off_at = scheduler.deadlines(loop - 1)
+    if on:
+        switch_on(
+            loop,
+            scheduler.flush,
+            total_loops=loop,
+            cycle_ends_in=int(scheduler.wall_time(off_at) * 1000),
+            next_cycle_at=None,
+        )
+    elif state["run_auto"] and not scheduler.stop.is_set():  # Still in the automatic program
+        switch_off(
+            loop,
+            scheduler.flush,
+            next_cycle_at=int(scheduler.wall_time(on_at + scheduler.loop_time) * 1000),
+            pump_timing=scheduler.timing(),
+        )
+        started = datetime.fromtimestamp(scheduler.wall_time(on_at))
+        started = started.strftime("%Y-%m-%d %H:%M:%S")
+        ended = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        # Write information to logging file
+        print(f"""Current program [{loop}]: Started {started} | Ended: {ended}""")
+        logger.warning(f"""Current program [{loop}]: Started {started} | Ended: {ended}""")
+    else:
+        # The program was stopped during the flush, the pump may have been switched on after
+        # the stop switched it off
+        with pump_lock:
+            if state["running"] and not state["run_manual"]:
+                switch_off(loop, scheduler.flush)
 
 
 ####################
@@ -207,72 +274,177 @@ def start_program(app=None):
     # program()
     """User defined task.
 
-    Creates a periodic task using user form input.
+    Creates a periodic task using user form input, which runs until the program is stopped.
     """
     # Save starting time programming
-    cache.set("auto_run_since", (datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+    started = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    state.update(auto_run_since=started, pump_timing=None)
 
     user_program = cache.get("user_program")
     # Turn the pump on every x seconds
     period = (user_program.get("close") + user_program.get("wait")) * UNIT
     cycle = user_program.get("flush") * UNIT  # Run the pump for the time of x seconds
-    while cache.get("run_auto"):
-        pump_cycle(cycle, period)
-        if not exit_thread.wait(timeout=period):
-            continue
-    else:
-        return False
-
+    scheduler = PumpScheduler(cycle, period, exit_thread)
+    scheduler.run(partial(pump_cycle, scheduler=scheduler))
+    logger.warning(f"Automatic program: Started {started} was closed forced by user")
+    return False
 
-def process_excel_files(flush, wait, close, uploaded_excel_files, plot):
-    """Start a new thread to process excel file uploaded by the user."""
-    # Loop throw all uploaded files and clean the data set
-    save_converted = False  # if to save .txt file converted into .xlsx file
 
-    # CALCULATE BLANKS
-    control_file_1 = os.path.join(os.path.dirname(uploaded_excel_files[0]), "C1.txt")
-    control_file_2 = os.path.join(os.path.dirname(uploaded_excel_files[0]), "C2.txt")
+def process_executor():
+    """Get the executor that runs the processing tasks.
 
-    for c in [control_file_1, control_file_2]:
-        C = ControlFile(flush, wait, close, c)
-        C_Total = Control(C)
-        C_Total.get_bank()
-    control = C_Total.calculate_blank()
-
-    ######################
-    #
-    ######################
+    With a single worker tasks run one after another on a background thread, avoiding the
+    process pool overhead on single core boards.
+    """
+    workers = min(app.config["PROCESS_WORKERS"], os.cpu_count() or 1)
+    if workers > 1:
+        # Workers are started from a clean server process instead of forking the app, whose
+        # threads may hold locks at fork time that would never be released on the workers
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(["scripts.processing"])
+        return ProcessPoolExecutor(max_workers=workers, mp_context=context)
+    return ThreadPoolExecutor(max_workers=1)
+
+
+def results_archive(project_folder, file_path, total_files):
+    """Get the archive path of a data file results, named after its project folder."""
+    name = os.path.basename(project_folder)
+    if total_files > 1:
+        name = f"{name}_{os.path.splitext(os.path.basename(file_path))[0]}"
+    return os.path.join(app.config["ZIP_FOLDER"], f"{name}.zip")
+
+
+def process_excel_files(flush, wait, close, uploaded_excel_files, plot, job=None):
+    """Process the excel files uploaded by the user.
+
+    Control files and data files are parsed and reduced in parallel, and data files write
+    their loops data and plots straight into their results archive on the way. Once all
+    controls are done the blank is merged into every data file resume, which is added to
+    the archive. The project folder is removed once archived.
+    Runs as a job of the jobs queue, which is used to report the job progress and the
+    metrics of its processing stages.
+    """
+    project_folder = os.path.dirname(uploaded_excel_files[0])
+    control_files = [os.path.join(project_folder, c) for c in ("C1.txt", "C2.txt")]
     total_files = len(uploaded_excel_files)
+    archives = {
+        file_path: results_archive(project_folder, file_path, total_files)
+        for file_path in uploaded_excel_files
+    }
+    for archive in archives.values():
+        if os.path.exists(f"{archive}.part"):  # Left by an interrupted job
+            os.remove(f"{archive}.part")
     logger.warning(f"A total of {total_files} files received")
-    for i, file_path in enumerate(uploaded_excel_files):
-        # generate_data(flush, wait, close, file_path, new_column_name, plot, plot_title)
-        experiment = ExperimentCycle(flush, wait, close, file_path)
-        if save_converted:
-            experiment.original_file.save()
-        resume = ResumeDataFrame(experiment)
-        resume.generate_resume(control)
-        if plot:
-            experiment.create_plot()
-        resume.save()
-
-        # TODO: add flag to save or not all converted file to excel
-        resume = ResumeDataFrame(experiment)
-
-        logger.warning(f"Task concluded {i+1}/{total_files}")
+    metrics.collect()  # Drop any stage left on this thread by a failed job
+    stages = []
+
+    def report(msg):
+        summary = metrics.summary(stages)
+        if job is not None:
+            jobs.progress(job, msg, summary)
         socketio.emit(
             "processing_files",
-            {"generating_files": True, "msg": f"fitxers processats {i+1}/{total_files}"},
+            {
+                "generating_files": True,
+                "msg": msg,
+                "job": getattr(job, "id_", None),
+                "metrics": summary,
+            },
             namespace="/resPi",
         )
-    cache.set("generating_files", False)
-    socketio.emit(
-        "processing_files", {"generating_files": False, "msg": ""}, namespace="/resPi"
-    )
+
+    with metrics.stage("job", total_files), process_executor() as executor:
+        # CALCULATE BLANKS
+        controls = [
+            executor.submit(measured, control_mo2, flush, wait, close, c)
+            for c in control_files
+        ]
+        resumes = [
+            executor.submit(
+                measured,
+                experiment_resume,
+                flush,
+                wait,
+                close,
+                file_path,
+                f"{archives[file_path]}.part",
+                plot,
+            )
+            for file_path in uploaded_excel_files
+        ]
+        values = []
+        for task in controls:
+            mo2, task_stages = task.result()
+            values.append(mo2)
+            stages += task_stages
+        control = calculate_blank(values)
+        for i, task in enumerate(as_completed(resumes)):
+            resume, task_stages = task.result()
+            stages += task_stages
+            # Only the resume is left to save once the blank is known
+            resume.apply_blank(control)
+            _, task_stages = measured(
+                save_resume, resume, f"{archives[resume.original_file]}.part"
+            )
+            stages += task_stages
+
+            logger.warning(f"Task concluded {i+1}/{total_files}")
+            report(f"fitxers processats {i+1}/{total_files}")
+        for archive in archives.values():
+            publish_archive(f"{archive}.part", project_folder, archive)
+        shutil.rmtree(project_folder)
+    stages += metrics.collect()
+    processing_metrics.add(stages)
+    report("fitxers arxivats")
+
+
+def jobs_changed(queue):
+    """Keep the files generation flag updated with the jobs queue state."""
+    state.update(generating_files=queue.active)
+    if not queue.active:
+        socketio.emit(
+            "processing_files", {"generating_files": False, "msg": ""}, namespace="/resPi"
+        )
+
+
+processing_metrics = Metrics()
+live = {"experiment": None, "stop": Event()}  # Live analysis of a growing probe file
+jobs = JobQueue(
+    process_excel_files,
+    f"{app.config['UPLOAD_FOLDER']}/jobs.json",
+    workers=app.config["JOB_WORKERS"],
+    on_change=jobs_changed,
+)
+
+
+def live_loop(result):
+    """Send the result of a loop from the live analysis."""
+    socketio.emit("live_loop", result, namespace="/resPi")
+
+
+def run_live(experiment, stop):
+    """Tail the live analysis file until stopped, or until it can't be analyzed."""
+    try:
+        experiment.run(stop)
+    except Exception as e:
+        logger.warning(f"Live analysis of {experiment.path} stopped: {e}")
+        socketio.emit("live_error", {"msg": str(e)}, namespace="/resPi")
+    finally:
+        stop.set()
 
 
 ####################
 # APP ROUTES
 ####################
+@app.before_request
+def start_jobs():
+    """Start the jobs workers, resuming any job left unfinished by a previous run.
+
+    Started with the first request, so only the process serving the app runs jobs.
+    """
+    jobs.start()
+
+
 @app.route("/", methods=["GET"])
 def landing():
     """Endpoint dispatcher to redirect user to the proper route."""
@@ -299,16 +471,15 @@ def respi():
         # Get information from user form data and run automatic program
         if request.form.get("action", False) == "start":
             # Avoids create a new thread if user reloads browser
-            if cache.get("running") or cache.get("run_auto"):
+            if state["running"] or state["run_auto"]:
                 pass
             else:
-                cache.set("run_auto", True)
                 flush = int(request.form["flush"])
                 wait = int(request.form["wait"])
                 close = int(request.form["close"])
                 # set program configuration on memory layer
                 cache.set("user_program", dict(close=close, flush=flush, wait=wait))
-                cache.set("total_loops", 0)
+                state.update(run_auto=True, total_loops=0)
                 session["user_program"] = [flush, wait, close]
                 # Create a register of the started thread
                 global _active_threads
@@ -318,29 +489,17 @@ def respi():
                 exit_thread.clear()  # set all thread flags to false
                 t.start()  # start a fresh new thread with the current program
         elif request.form.get("action", False) == "stop":
-            switch_off()  # TODO: Must be checked first
-            # Remove counters/timers and stop background thread
-            cache.set_many(
-                (
-                    ("running", False),
-                    ("cycle_ends", None),
-                    ("next_cycle_at", None),
-                    ("run_auto", False),
-                )
-            )
+            # Stop the background thread first, so it doesn't switch the pump on again
             exit_thread.set()
+            switch_off(run_auto=False)
         ###########################
         # MANUAL MODE
         ###########################
         if request.form.get("manual", False):
             if request.form["manual"] == "start_manual":
-                cache.set_many(
-                    (("started_at", to_js_time(run_type="manual")), ("run_manual", True))
-                )
-                switch_on()
+                switch_on(started_at=to_js_time(run_type="manual"), run_manual=True)
             else:
-                switch_off()
-                cache.set("run_manual", False)
+                switch_off(run_manual=False)
 
     # Populate form inputs with last inserted program or from config file values
     if not cache.get("user_program"):
@@ -368,7 +527,6 @@ def excel_files():
         close = int(request.form.get("close"))
         plot = True if request.form.get("plot") else False
 
-        cache.set("generating_files", True)
         # Save file to the system
         # NOTE: Must check for extensions
         data_file = request.files.get("data_file")
@@ -396,27 +554,31 @@ def excel_files():
         # Here filename complete with extension
         control_file_1.filename = "C1.txt"
         control_file_2.filename = "C2.txt"
-        # Save all files into project folder
-        files_list = [data_file, control_file_1, control_file_2]
-        for file_ in files_list:
-            file_path = os.path.join(project_folder, file_.filename)
-            file_.save(file_path)
-        # CHECK HEADERS
-        check = checker(file_path).match()
-        if check is not True:
-            for msg in check:
-                msg += " "
-            flash(check, "danger")
-            # Removes folder and file that doesn't match headers
-            shutil.rmtree(os.path.dirname(file_path))
-            return redirect("excel_files")
-        # save the full path of the saved file
-        uploaded_excel_files.append(os.path.join(project_folder, data_file.filename))
-
-        t = Thread(
-            target=process_excel_files, args=(flush, wait, close, uploaded_excel_files, plot),
-        )
-        t.start()
+        try:
+            # Save all files into project folder, their headers were checked while uploading
+            files_list = [data_file, control_file_1, control_file_2]
+            check = []
+            for file_ in files_list:
+                file_path = os.path.join(project_folder, file_.filename)
+                check += save_upload(file_, file_path) or []
+            if check:
+                flash(check, "danger")
+                # Removes folder and file that doesn't match headers
+                shutil.rmtree(project_folder)
+                return redirect("excel_files")
+            # save the full path of the saved file
+            uploaded_excel_files.append(os.path.join(project_folder, data_file.filename))
+
+            jobs.submit(
+                flush=flush,
+                wait=wait,
+                close=close,
+                uploaded_excel_files=uploaded_excel_files,
+                plot=plot,
+            )
+        except Exception:
+            shutil.rmtree(project_folder, ignore_errors=True)
+            raise
 
         # Fixed
         session["excel_config"] = {"flush": flush, "wait": wait, "close": close}
@@ -511,6 +673,24 @@ def read_log(log):
     return log_
 
 
+@app.route("/pump_events", methods=["GET"])
+def pump_events():
+    """Return the pump events between the start and end times.
+
+    Times are unix timestamps or ISO dates, and both are optional. At most `limit` events
+    are returned, up to MAX_EVENTS.
+    """
+    try:
+        start, end = (to_timestamp(request.args.get(arg)) for arg in ("start", "end"))
+        limit = int(request.args.get("limit") or MAX_EVENTS)
+        if not 1 <= limit <= MAX_EVENTS:
+            raise ValueError(f"limit must be between 1 and {MAX_EVENTS}")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    journal.flush()
+    return jsonify({"events": journal.events(start, end, limit)})
+
+
 @app.route("/download_log/<log>")
 def download_log(log):
     """Download a log file."""
@@ -568,20 +748,74 @@ def restart():
 
 @app.route("/status", methods=["GET"])
 def get_status():
-    """Return information about the different components of the system."""
-    return jsonify(
-        {
-            "running": cache.get("running"),
-            "run_auto": cache.get("run_auto"),
-            "run_manual": cache.get("run_manual"),
-            "started_at": cache.get("started_at"),
-            "cycle_ends_in": cache.get("cycle_ends_in"),
-            "next_cycle_at": cache.get("next_cycle_at"),
-            "generating_files": cache.get("generating_files"),
-            "total_loops": cache.get("total_loops"),
-            "auto_run_since": cache.get("auto_run_since"),
-        }
+    """Return information about the different components of the system.
+
+    The state version is the ETag, so clients revalidating an unchanged state get a 304.
+    """
+    snapshot = state.snapshot()
+    response = jsonify(snapshot)
+    response.set_etag(f"{state.boot}-{snapshot['version']}")
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+@app.route("/jobs", methods=["GET"])
+def get_jobs():
+    """Return the state and progress of all processing jobs."""
+    return jsonify(jobs.to_list())
+
+
+@app.route("/jobs/<id_>", methods=["GET"])
+def get_job(id_):
+    """Return the state and progress of a processing job."""
+    job = jobs.jobs.get(id_)
+    if job is None:
+        return jsonify({"error": f"Job {id_} not found"}), 404
+    return jsonify(job.to_dict())
+
+
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    """Return the aggregated processing stages metrics of all jobs since the app started."""
+    return jsonify(processing_metrics.to_dict())
+
+
+@app.route("/live", methods=["GET"])
+def live_status():
+    """Return the results of the live analysis loops done so far."""
+    experiment = live["experiment"]
+    if experiment is None:
+        return jsonify({"running": False})
+    return jsonify(dict(experiment.to_dict(), running=not live["stop"].is_set()))
+
+
+@app.route("/live/start", methods=["POST"])
+@login_required
+def start_live():
+    """Start the live analysis of a probe file while the experiment is recording it."""
+    if live["experiment"] is not None and not live["stop"].is_set():
+        return jsonify({"error": "Live analysis already running"}), 409
+    path = request.form.get("path", "")
+    if not os.path.isfile(path):
+        return jsonify({"error": f"File {path} not found"}), 404
+    config = config_from_file()["pump_control_config"]
+    flush, wait, close = (
+        int(request.form.get(phase, config[phase])) for phase in ("flush", "wait", "close")
     )
+    blank = float(request.form.get("blank", 0))
+    experiment = LiveExperiment(path, flush, wait, close, on_loop=live_loop, blank=blank)
+    live.update(experiment=experiment, stop=Event())
+    logger.warning(f"Live analysis of {path} started")
+    Thread(target=run_live, args=(experiment, live["stop"]), daemon=True).start()
+    return jsonify(dict(experiment.to_dict(), running=True))
+
+
+@app.route("/live/stop", methods=["POST"])
+@login_required
+def stop_live():
+    """Stop the live analysis."""
+    live["stop"].set()
+    return jsonify({"running": False})
 
 
 @app.route("/user_time/<local_time>", methods=["GET", "POST"])
@@ -0,0 +1,70 @@
+"""Zip archive sink for the processing results.
+
+Output writers stream each file straight into the archive as soon as it is produced, instead
+of writing it into the project folder to be zipped later, so results only go through the SD
+card once. Each archive member is compressed according to its extension: files that are
+already compressed are stored as they are.
+"""
+import io
+import os
+import zipfile
+
+# Already compressed formats, compressing them again only takes time
+STORED = [".xlsx", ".zip", ".gz", ".npz", ".png", ".jpg", ".jpeg"]
+
+
+class ArchiveSink:
+    """Zip archive where output files are written as streams.
+
+    compression: mapping of file extension to zipfile compression method, used instead of
+        the default one for members with that extension.
+    """
+
+    def __init__(
+        self, path, mode="w", compression=None, default=zipfile.ZIP_DEFLATED, compresslevel=6
+    ):  # noqa
+        self.path = path
+        self.compression = {ext: zipfile.ZIP_STORED for ext in STORED}
+        self.compression.update(compression or {})
+        self.default = default
+        self.compresslevel = compresslevel
+        self.zip_file = zipfile.ZipFile(path, mode, allowZip64=True)
+
+    def __contains__(self, name):
+        return name in self.zip_file.NameToInfo
+
+    def compress_type(self, name):
+        return self.compression.get(os.path.splitext(name)[1].lower(), self.default)
+
+    def open(self, name, text=False, compress_type=None):
+        """Open a new archive member to be written as a stream."""
+        info = zipfile.ZipInfo(name)
+        info.compress_type = compress_type or self.compress_type(name)
+        if info.compress_type == zipfile.ZIP_DEFLATED:
+            info._compresslevel = self.compresslevel
+        info.external_attr = 0o644 << 16
+        stream = self.zip_file.open(info, "w", force_zip64=True)
+        if text:
+            return io.TextIOWrapper(stream, encoding="utf-8")
+        return stream
+
+    def writestr(self, name, data):
+        """Write a complete member at once."""
+        with self.open(name, text=isinstance(data, str)) as f:
+            f.write(data)
+
+    def add_folder(self, folder):
+        """Copy all files of a folder into the archive."""
+        for name in sorted(os.listdir(folder)):
+            path = os.path.join(folder, name)
+            if os.path.isfile(path) and name not in self:
+                self.zip_file.write(path, name, compress_type=self.compress_type(name))
+
+    def close(self):
+        self.zip_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
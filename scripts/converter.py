@@ -1,35 +1,55 @@
 """File convert utilities."""
 import os
-import math
-import datetime
+from functools import cached_property
 
-import chardet
+import numpy as np
 import pandas as pd
-import plotly.express as px
 import plotly.graph_objects as go
+from plotly.offline import get_plotlyjs
 
-from scripts.utils import string_to_float, config_from_file
+from scripts import metrics
+from scripts.export import StreamingWorkbook
+from scripts.file_cache import ParsedCache, file_hash
+from scripts.parser import read_header, read_probe_file
+from scripts.segmentation import LoopIndex
+from scripts.stats import R2AB, trendlines, trendline_data
+from scripts.utils import config_from_file, to_datetime_column
 
-experiment_file_config = config_from_file()["experiment_file_config"]
+TEMP_COL = "SDWA0003000061      , CH 1 temp [°C]"
+OVERVIEW_POINTS = 4000  # Maximum points of each channel on the overview plot
+OVERVIEW_BOUNDARIES = 300  # Maximum loops marked on the overview plot, 3 points per line
+PLOTLYJS = "plotly.min.js"  # Bundle shared by the plots of the same folder
 
 
-def get_loop_seconds(data: dict) -> int:
-    """Calculate total loop time in seconds"""
-    return (data["end"] - data["start"]).seconds
+def calculate_ox(ox_value, start_value):
+    """Calculate the evolution of time.
 
+    Works with a single value or a whole time stamp code column.
+    """
+    return (ox_value - start_value) / 60
 
-def convert_datetime(dt: str):
-    """Convert a date time str representation to a python datetime object."""
-    try:
-        return datetime.datetime.strptime(dt, "%d/%m/%Y %H:%M:%S")
-    except ValueError:  # only for testing
-        return datetime.datetime.strptime(dt, "%Y-%m-%d %H:%M:%S")
 
+def downsample_index(values, buckets: int):
+    """Select the rows that keep the shape of a long series using min/max buckets.
 
-def calculate_ox(ox_value, start_value):
-    """Calculate the evolution of time."""
-    return (float(ox_value) - float(start_value)) / 60
-    # return [calculate_ox(value) for value in lst_self.time_stamp_code]
+    Values are split into buckets of consecutive rows and, from each one, the rows with the
+    minimum and maximum values are kept, plus the first and the last row. Returns at most
+    `2 * buckets + 2` sorted rows positions, no matter the length of the series.
+    """
+    values = np.asarray(values, dtype="float64")
+    total = len(values)
+    if total <= 2 * buckets + 2:
+        return np.arange(total)
+    size = -(-total // buckets)  # rounds up
+    padded = np.full(buckets * size, np.nan)
+    padded[:total] = values
+    padded = padded.reshape(buckets, size)
+    nan = np.isnan(padded)
+    first = np.arange(buckets) * size
+    lows = first + np.where(nan, np.inf, padded).argmin(axis=1)
+    highs = first + np.where(nan, -np.inf, padded).argmax(axis=1)
+    rows = np.concatenate([[0, total - 1], lows, highs])
+    return np.unique(rows[rows < total])
 
 
 class FileFormater:
@@ -52,38 +72,35 @@ class FileFormater:
     @property
     def file_encoding(self):
         """Get encoding from the given text file."""
-        with open(self.file_, "rb") as f:
-            raw = b"".join([f.readline() for _ in range(20)])
-
-        return chardet.detect(raw)["encoding"]
-
-    def information_index(self, df):
-        for index, dt in enumerate(df):
-            if df.iloc[index][0] == self.dt_col_name:
-                return index
-
-    def to_dataframe(self, output="xlsx"):
-        df = pd.read_table(self.file_, encoding=self.file_encoding, decimal=",")
-        for index, dt in enumerate(df):
-            if df.iloc[index][0] == self.dt_col_name:
-                break
-
-        col_idx = index
-        df = df[col_idx:]
-        columns_name = list(df.iloc[0])[:6]
-        # Drop all NaN columns
-        df = df.dropna(axis=1)
-        # Set new columns names
-        df.columns = columns_name
-        df.reset_index(inplace=True, drop=True)
-        df.drop(0, 0, inplace=True)  # remove the line were was the columns name
-
-        # Change date time column to a python datetime object
-        df[self.dt_col_name] = df[self.dt_col_name].map(convert_datetime)
+        return read_header(self.file_, self.dt_col_name).encoding
+
+    def parse(self) -> pd.DataFrame:
+        """Parse the txt file into a typed data frame."""
+        df = read_probe_file(self.file_, self.dt_col_name)
+        # Change date time column to a datetime64 column
+        df[self.dt_col_name] = to_datetime_column(df[self.dt_col_name])
+        return df
+
+    def to_dataframe(self, output="xlsx", cache=None):
+        """Load the txt file data.
+
+        With a parsed files cache, the file is parsed only if its content isn't cached yet.
+        """
+        with metrics.stage("parse") as stage:
+            if cache is None:
+                df = self.parse()
+            else:
+                key = cache.key(file_hash(self.file_), self.dt_col_name)
+                df = cache.get(key)
+                if df is None:
+                    df = self.parse()
+                    cache.put(key, df)
+            stage["rows"] = len(df)
         self.df = df
         self.output = output
         if self.save_converted:
-            self.save(output)
+            with metrics.stage("save_converted", len(df)):
+                self.save(output)
 
     def save(self, name=None):
         """Export converted DF to a new file."""
@@ -93,7 +110,27 @@ class FileFormater:
             self.df.to_csv(self.converted_file)
         else:
             self.converted_file = f"{self.file_output}.xlsx"
-            self.df.to_excel(self.converted_file, index=False)
+            with StreamingWorkbook(self.converted_file) as workbook:
+                workbook.add_sheet(self.fname, self.df, index=False)
+
+
+class LoopPhase:
+    """Duration of a loop phase.
+
+    Changing it invalidates all the experiment data derived from the loops.
+    """
+
+    def __set_name__(self, owner, name):
+        self.attr = f"_{name}"
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        return getattr(instance, self.attr)
+
+    def __set__(self, instance, value):
+        setattr(instance, self.attr, value)
+        instance.invalidate()
 
 
 class ExperimentCycle:
@@ -107,15 +144,30 @@ class ExperimentCycle:
     discard_time: total of time that will be discard per cycle on data frame creation.
         cycle = flush + wait + close
     dt_col_name: Name of that contains the experiment time spans
+
+    The loop index and the data derived from it are calculated once, on first access, and
+    cached until any loop phase duration changes.
     """
 
-    def __init__(self, flush: int, wait: int, close: int, original_file: str):  # noqa
+    flush = LoopPhase()
+    wait = LoopPhase()
+    close = LoopPhase()
+    # Cached attributes derived from the loop phases
+    derived = [
+        "loop_index",
+        "total_of_loops",
+        "loop_data_range",
+        "loop_close_range",
+        "df_close_list",
+        "fits",
+    ]
+
+    def __init__(
+        self, flush: int, wait: int, close: int, original_file: str, save_converted=True
+    ):  # noqa
         self.flush = flush
         self.wait = wait
         self.close = close
-        self.discard_time = flush + wait  # time-span to discard from each information cycle
-        self.loop_time = flush + wait + close
-        self.format_file(original_file)
 
         # LOAD ALL CONFIG FROM FILE
         config = config_from_file()["experiment_file_config"]
@@ -126,109 +178,164 @@ class ExperimentCycle:
         self.y = config["Y_COL"]
         self.plot_title = config["PLOT_TITLE"]
         self.save_loop_df = config["SAVE_LOOP_DF"]
+        # Loops are saved with the resume, one per sheet or "single" sheet for all of them
+        self.loop_sheets = config.get("LOOP_SHEETS", "per_loop")
+        self.temp_col = config.get("TEMP_COL", TEMP_COL)
+
+        self.format_file(original_file, save_converted)
 
-    def format_file(self, original_file):
+    def format_file(self, original_file, save_converted=True):
+        """Load the experiment file data.
+
+        save_converted: if False the converted file is never saved, even if it is enabled on
+            the configuration, e.g. when the experiment is loaded again only to read its data.
+        """
         txt_file = FileFormater(original_file)
-        txt_file.to_dataframe()
+        txt_file.save_converted = txt_file.save_converted and save_converted
+        txt_file.to_dataframe(cache=ParsedCache())
         self.df = txt_file.df
         self.original_file = txt_file
 
     @property
-    def total_of_loops(self) -> int:
-        """Calculate the total amount of time that last the experiment.
+    def discard_time(self) -> int:
+        """Time-span to discard from each information cycle."""
+        return self.flush + self.wait
+
+    @property
+    def loop_time(self) -> int:
+        """Complete loop time-span."""
+        return self.flush + self.wait + self.close
+
+    def invalidate(self):
+        """Remove all cached data derived from the loops."""
+        for attr in self.derived:
+            self.__dict__.pop(attr, None)
 
-        Using the first record and the last one we calculate here the total time.
-        Using this total
-        (timedelta object) seconds are calculated and divided by the portion of each cycle
-        by hour.
-        This information is needed in order to calculate the number of cycle of the experiment.
+    @cached_property
+    def loop_index(self) -> LoopIndex:
+        """Split the experiment into loops using the records timestamps.
+
+        The loop index is built over the sorted time column, so records are sorted first if
+        needed.
         """
-        time_diff = self.df[self.dt_col_name].iloc[-1] - self.df[self.dt_col_name].iloc[0]
-        time_diff.seconds
-        # Put every time value into seconds
-        total = (time_diff).seconds / (self.loop_time * 60)
-        # rounds up the decimal number
-        return math.ceil(total)
+        with metrics.stage("segmentation", len(self.df)):
+            if not self.df[self.dt_col_name].is_monotonic_increasing:
+                self.df = self.df.sort_values(self.dt_col_name, kind="mergesort")
+                self.df.reset_index(inplace=True, drop=True)
+            times = self.df[self.dt_col_name].values
+            return LoopIndex(times, self.flush, self.wait, self.close)
+
+    @cached_property
+    def total_of_loops(self) -> int:
+        """Total of loops of the experiment that have close phase data."""
+        return len(self.loop_index)
 
-    @property
+    @cached_property
     def loop_data_range(self) -> dict:
         """Create a time ranges of each complete loop of the experiment."""
-        loop_range = {}
-        start = self.df[self.dt_col_name].iloc[0]
-        for i in range(self.total_of_loops):
-            end = start + datetime.timedelta(minutes=self.loop_time)
-            loop_range[i + 1] = {"start": start, "end": end}
-            start = end + datetime.timedelta(minutes=self.loop_time)
-        return loop_range
+        return self.loop_index.ranges()
 
-    @property
+    @cached_property
     def loop_close_range(self) -> dict:
         """Create a time ranges of each close part of the experiment."""
-        close_range = {}
-        start = self.df[self.dt_col_name].iloc[0] + datetime.timedelta(
-            minutes=self.discard_time
-        )
-        for i in range(self.total_of_loops):
-            end = start + datetime.timedelta(minutes=self.close)
-            close_range[i + 1] = {"start": start, "end": end}
-            start = end + datetime.timedelta(minutes=self.discard_time)
-        return close_range
+        return self.loop_index.ranges("close")
 
-    @property
+    @cached_property
     def df_close_list(self):
-        k = 0
-        lst = []
-        start = 0
-        end = 0
-        for k, v in self.loop_data_range.items():
-            end += get_loop_seconds(v)
-            df_close = self._close_df(start, end)
-            start = end + 1
-            end += 1
-            if self.save_loop_df:
-                self.save(df_close, name=str(k))
-            lst.append(df_close)
-            k += 1
-        return lst
-
-    def _close_df(self, start: datetime, end: datetime) -> pd.DataFrame:
+        return [self._close_df(rows) for rows in self.loop_index.slices("close")]
+
+    @cached_property
+    def fits(self) -> R2AB:
+        """Trendline of the close phase of every loop, all loops fitted at once."""
+        labels, rows = self.loop_index.members("close")
+        time_stamp_code = self.df[self.time_stamp_code].values
+        start_values = time_stamp_code[self.loop_index.rows[:, 2]]
+        x = calculate_ox(time_stamp_code[rows], start_values[labels])
+        y = self.df[self.O2_COL].values[rows]
+        return trendlines(x, y, labels)
+
+    def fit(self, i: int) -> R2AB:
+        """Trendline of the close phase of the loop in the given index position."""
+        return R2AB(*(values[i] for values in self.fits))
+
+    def _close_df(self, rows: slice) -> pd.DataFrame:
         """Create a DF with the close information.
 
         Generate a new df from each individual loop containing only the information from the
         close part of the cycle.
         """
         # Create a new DF with close information
-        start = start + (self.discard_time * 60)
-        df_close = self.df[start:end]
-        df_close.reset_index(inplace=True, drop=True)
+        df_close = self.df.iloc[rows].reset_index(drop=True)
         # Create the new column of oxygen evolution
         #  Create a new column for o2 evolution and calculate_ox_evolution
         start_value = df_close[self.time_stamp_code].iloc[0]
-        df_close[self.x] = df_close[self.time_stamp_code].apply(
-            calculate_ox, args=(start_value,)
-        )
+        df_close[self.x] = calculate_ox(df_close[self.time_stamp_code], start_value)
         # self.O2_COL = "SDWA0003000061      , CH 1 O2 [% air saturation]"
-        df_close[self.y] = df_close[self.O2_COL].map(string_to_float)
+        df_close[self.y] = df_close[self.O2_COL]
         return df_close
 
-    def create_plot(self, format_="html"):
-        for i, df_close in enumerate(self.df_close_list):
-            Plot(
-                df_close,
-                self.x,
-                self.y,
-                self.plot_title,
+    def create_plot(self, format_="html", plotlyjs="directory", sink=None):
+        with metrics.stage("plot", self.total_of_loops):
+            # Loops data is built one loop at a time, only while it is plotted
+            for i, rows in enumerate(self.loop_index.slices("close")):
+                Plot(
+                    self._close_df(rows),
+                    self.x,
+                    self.y,
+                    self.plot_title,
+                    dst=os.path.dirname(self.original_file.file_output),
+                    fname=f"df_plot_{i + 1}",  # TODO: must be user o decides name
+                    fit=self.fit(i),
+                    plotlyjs=plotlyjs,
+                    sink=sink,
+                ).create()
+
+    def create_overview_plot(self, plotlyjs="directory", sink=None):
+        with metrics.stage("overview_plot", len(self.df)):
+            OverviewPlot(
+                self,
                 dst=os.path.dirname(self.original_file.file_output),
-                fname=f"df_plot_{i + 1}",  # TODO: must be user o decides name
+                plotlyjs=plotlyjs,
+                sink=sink,
             ).create()
 
-    def save(self, df_loop, name):
-        return df_loop.to_excel(f"{self.original_file.folder_dst}/df_loop_{name}.xlsx")
+
+def write_figure(fig, fname, dst=None, sink=None, plotlyjs="directory"):
+    """Write a plot html file into the dst folder, or straight into an archive sink.
+
+    The shared plotly.js bundle is written into the archive along with its first plot.
+    """
+    if sink is None:
+        fig.write_html(f"{dst}/{fname}", include_plotlyjs=plotlyjs)
+        return
+    if plotlyjs == "directory" and PLOTLYJS not in sink:
+        sink.writestr(PLOTLYJS, get_plotlyjs())
+    with sink.open(fname, text=True) as f:
+        fig.write_html(f, include_plotlyjs=plotlyjs)
 
 
 class Plot:
+    """Plot of the close phase of a loop and its trendline.
+
+    plotlyjs: how the plotly.js library is included into the html file. By default all plots
+    in the same folder share a single plotly.min.js bundle, written once next to them, instead
+    of embedding the ~3MB library into each file. Use True for standalone html files.
+    sink: optional archive where the plot is written, instead of the dst folder.
+    """
+
     def __init__(
-        self, data, x_axis, y_axis, title, *, dst=None, fname="dataframe", output="html",
+        self,
+        data,
+        x_axis,
+        y_axis,
+        title,
+        *,
+        dst=None,
+        fname="dataframe",
+        output="html",
+        fit=None,
+        plotlyjs="directory",
+        sink=None,
     ):
         self.data = data
         self.x_axis = x_axis
@@ -237,6 +344,10 @@ class Plot:
         self.output = output
         self.fname = fname
         self.dst = dst
+        self.plotlyjs = plotlyjs
+        self.sink = sink
+        # Trendline values, fitted here if not given
+        self.fit = fit if fit is not None else trendline_data(data, x_axis, y_axis)
 
     def create(self):
         print("Creating plots")
@@ -248,12 +359,120 @@ class Plot:
                 x=x, y=y, name=self.title, line=dict(color="red", width=1), showlegend=True,
             )
         )
-        fig1 = px.scatter(self.data, x=x, y=y, trendline="ols")
-        trendline = fig1.data[1]
-        fig.add_trace(trendline)
+        fig.add_trace(self.trendline(x))
         fig.update_layout(dict(title=self.title))
 
-        fig.write_html(f"{self.dst}/{self.fname}.{self.output}")
+        write_figure(
+            fig, f"{self.fname}.{self.output}", self.dst, self.sink, plotlyjs=self.plotlyjs
+        )
+
+    def trendline(self, x):
+        """Create the trendline trace from the fitted a and b values."""
+        x = [x.min(), x.max()]
+        rsquared, a, b = self.fit
+        return go.Scatter(
+            x=x,
+            y=[a + b * value for value in x],
+            mode="lines",
+            name=f"y = {b:.4f}x + {a:.4f} (R<sup>2</sup> = {rsquared:.4f})",
+            showlegend=True,
+        )
+
+
+class OverviewPlot:
+    """Plot of the O2 and temperature records of a whole experiment.
+
+    Records are downsampled to a bounded amount of points, which keeps their shape, and
+    drawn with WebGL, so the plot loads fast no matter how long the experiment is. The start
+    of the loops and of their close phase are marked with vertical lines, thinned to one
+    every few loops on long experiments, so the lines points are bounded as well.
+    """
+
+    def __init__(
+        self,
+        experiment,
+        *,
+        dst=None,
+        fname="df_plot_overview",
+        output="html",
+        points=OVERVIEW_POINTS,
+        boundaries=OVERVIEW_BOUNDARIES,
+        plotlyjs="directory",
+        sink=None,
+    ):
+        self.experiment = experiment
+        self.dst = dst
+        self.fname = fname
+        self.output = output
+        self.points = points
+        self.max_boundaries = boundaries
+        self.plotlyjs = plotlyjs
+        self.sink = sink
+
+    def channel(self, column, **kwargs):
+        """Create the trace of a downsampled record column."""
+        df = self.experiment.df
+        values = df[column].values
+        rows = downsample_index(values, self.points // 2)
+        return go.Scattergl(
+            x=df[self.experiment.dt_col_name].values[rows],
+            y=values[rows],
+            name=column.split(",")[-1].strip(),
+            mode="lines",
+            **kwargs,
+        )
+
+    def boundaries(self, times, low, high, **kwargs):
+        """Create a single trace with a vertical line at each given time."""
+        x = np.repeat(times, 3)
+        y = np.tile(np.array([low, high, np.nan]), len(times))  # NaN breaks the line
+        return go.Scattergl(x=x, y=y, mode="lines", connectgaps=False, **kwargs)
+
+    def create(self):
+        experiment = self.experiment
+        o2 = experiment.df[experiment.O2_COL]
+        low, high = o2.min(), o2.max()
+        bounds = experiment.loop_index.bounds
+        step = -(-len(bounds) // self.max_boundaries) if len(bounds) else 1  # ceil
+        bounds = bounds[::step]
+        fig = go.Figure()
+        fig.add_trace(self.channel(experiment.O2_COL, line=dict(color="red", width=1)))
+        if experiment.temp_col in experiment.df:
+            fig.add_trace(
+                self.channel(experiment.temp_col, yaxis="y2", line=dict(color="blue", width=1))
+            )
+        fig.add_trace(
+            self.boundaries(
+                bounds[:, 0],
+                low,
+                high,
+                name="Loop" if step == 1 else f"Loop (1 of {step})",
+                line=dict(color="gray", width=1),
+            )
+        )
+        fig.add_trace(
+            self.boundaries(
+                bounds[:, 2],
+                low,
+                high,
+                name="Close",
+                line=dict(color="green", width=1, dash="dot"),
+            )
+        )
+        fig.update_layout(
+            dict(
+                title=experiment.plot_title,
+                yaxis=dict(title=experiment.O2_COL.split(",")[-1].strip()),
+                yaxis2=dict(
+                    title=experiment.temp_col.split(",")[-1].strip(),
+                    overlaying="y",
+                    side="right",
+                ),
+            )
+        )
+        write_figure(
+            fig, f"{self.fname}.{self.output}", self.dst, self.sink, plotlyjs=self.plotlyjs
+        )
 
 
 ControlFile = ExperimentCycle
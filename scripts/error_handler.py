@@ -1,14 +1,13 @@
 """Confirm that input file have the expected structure."""
 import json
+from functools import cached_property
 
-from scripts.converter import ExperimentCycle
+from scripts.parser import read_header
 from scripts.utils import config_from_file
 
 error_template = """Your file value: '{}', is different from the expected value of your
 configuration file: '{}'"""
 
-config = config_from_file()["experiment_file_config"]
-
 
 class HeadersException(Exception):
     """Check that headers are present."""
@@ -49,9 +48,9 @@ class HeadersChecker:
         self.file_headers = file_headers
         self.missing = set()
 
-    @property
+    @cached_property
     def app_config(self):
-        """Get configuration from json file.
+        """Get configuration from json file, once per checker.
 
         Generates a new dictionary using the config values as key values, in order to be able
         to handle missing headers names as missing key values, using KeyError exceptions.
@@ -89,13 +88,27 @@ class GUIChecker:
         self.file_ = file_
 
     def match(self):
-        exp = ExperimentCycle(0, 0, 0, self.file_)
-        h = HeadersChecker(exp.df.columns)
+        """Check the uploaded file headers.
+
+        Only the file preamble and the header line are read, the file data is parsed later by
+        the processing job.
+        """
+        dt_col_name = config_from_file()["experiment_file_config"]["DT_COL"]
         try:
-            h.check()
-            return True
-        except (WrongDT, WrongO2, WrongTimeStamp):
-            return h.missing
+            file_headers = read_header(self.file_, dt_col_name).columns
+        except ValueError:  # There is no header line with the date time column
+            file_headers = []
+        return check_headers(file_headers)
+
+
+def check_headers(file_headers):
+    """Check a file headers, returning True if they match the configuration or the errors."""
+    h = HeadersChecker(file_headers)
+    try:
+        h.check()
+        return True
+    except (WrongDT, WrongO2, WrongTimeStamp):
+        return h.missing
 
 
 checker = GUIChecker
@@ -0,0 +1,63 @@
+"""Streaming excel export.
+
+Data frames are written to the workbook row by row using the openpyxl write only mode, which
+streams every row to disk as soon as is appended. Memory used by the export is bounded by a
+single row, no matter how many rows or sheets the workbook has.
+"""
+import math
+
+import pandas as pd
+from openpyxl import Workbook
+
+MAX_TITLE_LENGTH = 31  # Excel limit for sheet names
+
+
+def cell_value(value):
+    """Convert a data frame value into a value supported by openpyxl."""
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if value is pd.NaT:
+        return None
+    return value
+
+
+class StreamingWorkbook:
+    """Excel workbook written one row at a time.
+
+    Sheets must be added in order, as once a new sheet is created the previous one can't be
+    changed anymore. The workbook is only complete once closed.
+    """
+
+    def __init__(self, path: str):  # noqa
+        self.path = path
+        self.workbook = Workbook(write_only=True)
+
+    def add_sheet(self, title: str, df: pd.DataFrame, index=True, extra=None):
+        """Write a data frame into a new sheet.
+
+        extra: optional (name, value) pair written as an additional first column.
+        """
+        sheet = self.workbook.create_sheet(title[:MAX_TITLE_LENGTH])
+        self.append(sheet, df, index=index, extra=extra, header=True)
+        return sheet
+
+    def append(self, sheet, df: pd.DataFrame, index=True, extra=None, header=False):
+        """Write the rows of a data frame at the end of a sheet."""
+        first = [] if extra is None else [extra[1]]
+        if header:
+            columns = ([] if extra is None else [extra[0]]) + ([None] if index else [])
+            sheet.append(columns + list(df.columns))
+        for row in df.itertuples(index=index, name=None):
+            sheet.append(first + [cell_value(value) for value in row])
+
+    def close(self):
+        """Write the workbook to its file."""
+        self.workbook.save(self.path)
+        self.workbook = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if self.workbook is not None:
+            self.close()
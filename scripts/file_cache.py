@@ -0,0 +1,147 @@
+"""Parsed files and results cache.
+
+Parsing a probe file is the most expensive part of processing it, and the same files are
+often processed again with different loop or volume values. Here the parsed and typed data
+frames are kept beside the uploads, keyed by the hash of the raw file content, so a file is
+only parsed once while it stays on the cache.
+
+Data frames are stored column by column as uncompressed numpy arrays, which are loaded back
+without any parsing. The cache size is bounded and the least recently used files are evicted
+first.
+The hash of an uploaded file is calculated while it arrives and remembered, so it isn't read
+again only to find it on the cache.
+Small results calculated from a file, like the mean MO2 of a control file, are kept as json
+files, keyed by the file hash and the parameters used to calculate them.
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # app root dir
+CACHE_FOLDER = f"{ROOT}/static/uploads/parsed_files"
+MAX_CACHE_SIZE = 512 * 1024 * 1024  # bytes
+VERSION = 1  # Must change when the parser output changes
+HASHES_FOLDER = f"{CACHE_FOLDER}/hashes"
+MAX_HASHES = 1000  # Remembered file hashes
+
+
+def stat_key(file_: str) -> str:
+    """Identify a file version by its inode, size and modification time."""
+    st = os.stat(file_)
+    return f"{st.st_dev}-{st.st_ino}-{st.st_size}-{st.st_mtime_ns}"
+
+
+def remember_hash(file_: str, digest: str, folder=HASHES_FOLDER):
+    """Keep the hash of a file calculated while it was written, so it isn't read again."""
+    os.makedirs(folder, exist_ok=True)
+    with open(os.path.join(folder, stat_key(file_)), "w") as f:
+        f.write(digest)
+    entries = sorted(os.scandir(folder), key=lambda e: e.stat().st_mtime)
+    for entry in entries[:-MAX_HASHES]:
+        os.remove(entry.path)
+
+
+def file_hash(file_: str, chunk_size: int = 1024 * 1024) -> str:
+    """Calculate the hash of a file content, unless it was already remembered."""
+    try:
+        with open(os.path.join(HASHES_FOLDER, stat_key(file_))) as f:
+            return f.read()
+    except OSError:
+        pass
+    h = hashlib.blake2b(digest_size=20)
+    with open(file_, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def cache_key(*values) -> str:
+    """Generate a cache key from a file content hash and the options used to handle it."""
+    h = hashlib.blake2b(digest_size=20)
+    for value in (VERSION, *values):
+        h.update(f"{value}\n".encode("utf-8"))
+    return h.hexdigest()
+
+
+class ParsedCache:
+    """Size bounded LRU cache of parsed data frames."""
+
+    def __init__(self, folder=CACHE_FOLDER, max_size=MAX_CACHE_SIZE):  # noqa
+        self.folder = folder
+        self.max_size = max_size
+
+    def key(self, content_hash: str, *options) -> str:
+        """Generate the cache key of a file content parsed with the given options."""
+        return cache_key(content_hash, *options)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.folder, f"{key}.npz")
+
+    def get(self, key: str):
+        """Get a cached data frame, or None if is not on the cache."""
+        path = self.path(key)
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                columns = list(data["columns"])
+                df = pd.DataFrame({name: data[f"c{i}"] for i, name in enumerate(columns)})
+        except (OSError, KeyError, ValueError):
+            return None
+        os.utime(path)  # Mark it as recently used
+        return df
+
+    def put(self, key: str, df: pd.DataFrame):
+        """Store a data frame. Data frames with non typed columns are not cached."""
+        arrays = {f"c{i}": df[name].values for i, name in enumerate(df.columns)}
+        if any(not isinstance(a, np.ndarray) or a.dtype.kind == "O" for a in arrays.values()):
+            return
+        os.makedirs(self.folder, exist_ok=True)
+        tmp = os.path.join(self.folder, f".{key}.{os.getpid()}.npz")
+        np.savez(tmp, columns=np.array(df.columns, dtype=str), **arrays)
+        os.replace(tmp, self.path(key))
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used files until the cache fits its maximum size."""
+        entries = []
+        with os.scandir(self.folder) as it:
+            for entry in it:
+                if entry.name.endswith(".npz") and not entry.name.startswith("."):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:  # Already evicted by another process
+                pass
+            total -= size
+
+
+class ResultsCache:
+    """Cache of small json serializable results."""
+
+    def __init__(self, folder=f"{CACHE_FOLDER}/results"):  # noqa
+        self.folder = folder
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.folder, f"{key}.json")
+
+    def get(self, key: str):
+        """Get a cached result, or None if is not on the cache."""
+        try:
+            with open(self.path(key)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key: str, value):
+        os.makedirs(self.folder, exist_ok=True)
+        tmp = os.path.join(self.folder, f".{key}.{os.getpid()}.json")
+        with open(tmp, "w") as f:
+            json.dump(value, f)
+        os.replace(tmp, self.path(key))
@@ -0,0 +1,204 @@
+"""Synthetic probe files generator.
+
+Writes probe .txt recordings as exported by the oxygen and temperature probe, preamble and
+header included, for tests and benchmarks. Each loop the O2 drops while the chamber is sealed,
+during the wait and close phases, and recovers once the flush pump starts again. Rows are
+built with vectorized numpy in chunks and streamed to disk, so memory use doesn't depend on
+the recording length.
+
+    python -m scripts.generator data.txt --hours 72 --gap-rate 0.001
+"""
+import argparse
+
+import numpy as np
+
+PREAMBLE = [
+    "PreSens Precision Sensing",
+    "Software version\t1.0",
+    "Device\tSDWA0003000061",
+    "",
+]
+COLUMNS = [
+    "Date &Time [DD-MM-YYYY HH:MM:SS]",
+    "Time stamp code",
+    "SDWA0003000061      , CH 1 O2 [mg/L]",
+    "SDWA0003000061      , CH 1 temp [°C]",
+    "SDWA0003000061      , CH 1 phase [°]",
+    "SDWA0003000061      , CH 1 amp",
+]
+CHUNK_SIZE = 500_000  # rows built and written at once
+EXPERIMENT_RATE = 0.03  # O2 consumption on sealed chamber [mg/L/min]
+CONTROL_RATE = 0.002  # Background consumption of a chamber without fish [mg/L/min]
+
+
+def o2_values(seconds, flush, wait, close, saturation, rate):
+    """O2 level of each record given its seconds since the start of the recording.
+
+    The O2 drops linearly while the chamber is sealed and recovers exponentially during
+    the flush.
+    """
+    flush, sealed = flush * 60, (wait + close) * 60
+    position = seconds % (flush + sealed)
+    drop = rate / 60 * np.clip(position - flush, 0, None)
+    recovery = rate / 60 * sealed * np.exp(-position / (flush / 5))
+    return saturation - np.where(position < flush, recovery, drop)
+
+
+def gaps_mask(rng, total, rate, max_length):
+    """Select the rows lost on random gaps, starting with `rate` probability on each row."""
+    starts = np.flatnonzero(rng.random(total) < rate)
+    lengths = rng.integers(1, max_length + 1, len(starts))
+    bounds = np.zeros(total + 1, dtype="int64")
+    np.add.at(bounds, starts, 1)
+    np.add.at(bounds, np.minimum(starts + lengths, total), -1)
+    return np.cumsum(bounds[:-1]) > 0
+
+
+# Records are built as text matrices, one row of ASCII codes per record, along with a mask of
+# the characters to keep, which drops the padding of variable width fields. Selecting the
+# kept characters gives the records text, all at once.
+
+
+def digits(values, width):
+    """ASCII codes of non negative integers, zero padded to the given width."""
+    powers = 10 ** np.arange(width - 1, -1, -1, dtype="int64")
+    return (values[:, None] // powers % 10 + ord("0")).astype("uint8")
+
+
+def text(chars: str, total: int):
+    """Same characters on every record."""
+    codes = np.frombuffer(chars.encode("ascii"), dtype="uint8")
+    return np.tile(codes, (total, 1)), np.ones((total, len(codes)), dtype=bool)
+
+
+def number_field(values, decimals=0):
+    """Numbers with a comma decimal mark, without padding."""
+    total = len(values)
+    scaled = np.rint(np.asarray(values) * 10 ** decimals).astype("int64")
+    negative = scaled < 0
+    scaled = np.abs(scaled)
+    whole = scaled // 10 ** decimals
+    width = len(str(whole.max())) if total else 1
+    powers = 10 ** np.arange(width - 1, -1, -1, dtype="int64")
+    keep = whole[:, None] >= powers  # drops leading zeros
+    keep[:, -1] = True
+    fields = [
+        (np.full((total, 1), ord("-"), dtype="uint8"), negative[:, None]),
+        (digits(whole, width), keep),
+    ]
+    if decimals:
+        fields += [text(",", total), (digits(scaled % 10 ** decimals, decimals), None)]
+    return join(fields)
+
+
+def datetime_field(values):
+    """Date times as DD/MM/YYYY HH:MM:SS."""
+    total = len(values)
+    day = values.astype("datetime64[D]")
+    month = values.astype("datetime64[M]")
+    seconds = (values - day).astype("int64")
+    fields = [
+        (digits((day - month).astype("int64") + 1, 2), None),
+        text("/", total),
+        (digits(month.astype("int64") % 12 + 1, 2), None),
+        text("/", total),
+        (digits(values.astype("datetime64[Y]").astype("int64") + 1970, 4), None),
+        text(" ", total),
+        (digits(seconds // 3600, 2), None),
+        text(":", total),
+        (digits(seconds // 60 % 60, 2), None),
+        text(":", total),
+        (digits(seconds % 60, 2), None),
+    ]
+    return join(fields)
+
+
+def join(fields):
+    """Join the fields text matrices into a single one."""
+    chars = np.hstack([c for c, _ in fields])
+    keep = np.hstack([np.ones(c.shape, dtype=bool) if k is None else k for c, k in fields])
+    return chars, keep
+
+
+def records(fields):
+    """Tab separated records text, with the instrument trailing tab and line ending."""
+    total = len(fields[0][0])
+    separated = []
+    for field in fields:
+        separated += [field, text("\t", total)]
+    chars, keep = join(separated + [text("\r\n", total)])
+    return chars[keep].tobytes()
+
+
+def generate_probe_file(
+    path: str,
+    seconds: int,
+    flush: int = 3,
+    wait: int = 2,
+    close: int = 20,
+    *,
+    start="2020-03-02T10:00:00",
+    saturation=8.0,
+    rate=EXPERIMENT_RATE,
+    noise=0.01,
+    temp=15.0,
+    temp_noise=0.05,
+    gap_rate=0.0,
+    max_gap=60,
+    seed=None,
+    encoding="latin-1",
+    chunk_size=CHUNK_SIZE,
+):  # noqa
+    """Write a 1 Hz probe recording of the given length in seconds.
+
+    flush, wait, close: loop phases duration in minutes.
+    rate: O2 consumption while the chamber is sealed, in mg/L per minute.
+    noise, temp_noise: standard deviation of the records gaussian noise.
+    gap_rate, max_gap: probability of a gap starting on each record, and its maximum length
+        in records. Gaps are kept within each written chunk.
+    Returns the number of records written.
+    """
+    rng = np.random.default_rng(seed)
+    start = np.datetime64(start, "s")
+    written = 0
+    with open(path, "wb") as f:
+        f.write("\r\n".join(PREAMBLE + ["\t".join(COLUMNS) + "\t", ""]).encode(encoding))
+        for first in range(0, seconds, chunk_size):
+            secs = np.arange(first, min(first + chunk_size, seconds))
+            if gap_rate:
+                secs = secs[~gaps_mask(rng, len(secs), gap_rate, max_gap)]
+            total = len(secs)
+            o2 = o2_values(secs, flush, wait, close, saturation, rate)
+            fields = [
+                datetime_field(start + secs.astype("timedelta64[s]")),
+                number_field(secs),
+                number_field(o2 + rng.normal(0, noise, total), 3),
+                number_field(temp + rng.normal(0, temp_noise, total), 3),
+                number_field(30 + rng.normal(0, 0.1, total), 3),
+                number_field(rng.integers(4900, 5100, total)),
+            ]
+            f.write(records(fields))
+            written += total
+    return written
+
+
+def generate_control_file(path: str, seconds: int, *args, **kwargs):
+    """Write a control recording, with the small O2 consumption of a chamber without fish."""
+    kwargs.setdefault("rate", CONTROL_RATE)
+    return generate_probe_file(path, seconds, *args, **kwargs)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic probe file.")
+    parser.add_argument("path")
+    parser.add_argument("--hours", type=float, default=24)
+    parser.add_argument("--loop", type=int, nargs=3, default=[3, 2, 20], metavar="MIN")
+    parser.add_argument("--control", action="store_true", help="generate a control file")
+    parser.add_argument("--gap-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+    generate = generate_control_file if args.control else generate_probe_file
+    rows = generate(
+        args.path, int(args.hours * 3600), *args.loop, gap_rate=args.gap_rate, seed=args.seed
+    )
+    print(f"{rows} records written to {args.path}")
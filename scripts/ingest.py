@@ -0,0 +1,182 @@
+"""Streaming ingestion of the uploaded probe files.
+
+Uploads are written to disk chunk by chunk while they arrive, and the same chunks are hashed
+and parsed on the way. The file headers are checked as soon as the header line arrives, and
+the records are parsed into typed columns in blocks, so once the upload is complete the
+parsed data frame goes straight into the parsed files cache and the file is never read again.
+"""
+import hashlib
+import io
+import os
+import tempfile
+
+import pandas as pd
+
+from scripts.error_handler import checker
+from scripts.file_cache import ParsedCache, remember_hash
+from scripts.parser import MAX_PREAMBLE_LINES, is_header, make_header, parse_records
+from scripts.utils import to_datetime_column
+
+BLOCK_SIZE = 4 * 1024 * 1024  # Raw bytes of records parsed at once
+
+
+class ProbeStreamParser:
+    """Parse a probe file from the chunks of raw bytes as they arrive.
+
+    check: optional function called with the table columns once the header is found, which
+        returns True if they are valid, or the list of errors found.
+    Records that can't be parsed stop the parsing, keeping the error in `parse_error`, so the
+    file is parsed again once saved, by whoever reads it.
+    """
+
+    def __init__(self, dt_col_name: str, check=None, block_size=BLOCK_SIZE):  # noqa
+        self.dt_col_name = dt_col_name
+        self.key = dt_col_name.encode("utf-8")
+        self.check = check
+        self.block_size = block_size
+        self.header = None
+        self.errors = None
+        self.parse_error = None
+        self._preamble = []
+        self._pending = b""  # Last incomplete line
+        self._block = []
+        self._block_size = 0
+        self._frames = []
+
+    @property
+    def failed(self) -> bool:
+        return self.errors is not None
+
+    def feed(self, data: bytes):
+        if self.failed or self.parse_error:
+            return
+        try:
+            self._feed(data)
+        except ValueError as e:
+            self._stop(e)
+
+    def _stop(self, error):
+        """Stop parsing, dropping the records parsed so far."""
+        self.parse_error = str(error)
+        self._pending, self._block, self._block_size, self._frames = b"", [], 0, []
+
+    def _feed(self, data: bytes):
+        data = self._pending + data
+        end = data.rfind(b"\n") + 1
+        self._pending = data[end:]
+        lines = data[:end]
+        if self.header is None:
+            lines = self._find_header(lines)
+        if lines:
+            self._block.append(lines)
+            self._block_size += len(lines)
+            if self._block_size >= self.block_size:
+                self._parse_block()
+
+    def _find_header(self, data: bytes) -> bytes:
+        """Look for the header line, returning the records after it."""
+        start = 0
+        while start < len(data):
+            end = data.index(b"\n", start) + 1
+            line = data[start:end]
+            self._preamble.append(line)
+            start = end
+            if is_header(line, self.key):
+                self.header = make_header(self._preamble)
+                if self.check is not None:
+                    check = self.check(self.header.columns)
+                    if check is not True:
+                        self.errors = check
+                return data[start:]
+            if len(self._preamble) > MAX_PREAMBLE_LINES:
+                self.errors = [f"Column '{self.dt_col_name}' not found"]
+                return b""
+        return b""
+
+    def _parse_block(self):
+        if self._block_size:
+            df = parse_records(io.BytesIO(b"".join(self._block)), self.header)
+            df[self.dt_col_name] = to_datetime_column(df[self.dt_col_name])
+            self._frames.append(df)
+        self._block, self._block_size = [], 0
+
+    def frames(self) -> list:
+        """Get and clear the data frames parsed so far."""
+        frames, self._frames = self._frames, []
+        return frames
+
+    def close(self) -> pd.DataFrame:
+        """Parse the remaining records and get the complete data frame."""
+        if self._pending:
+            self.feed(b"\n")
+        if self.header is None and not (self.failed or self.parse_error):
+            self.errors = [f"Column '{self.dt_col_name}' not found"]
+        if self.failed or self.parse_error:
+            return None
+        try:
+            self._parse_block()
+        except ValueError as e:
+            self._stop(e)
+        if not self._frames:
+            return None
+        df = pd.concat(self._frames, ignore_index=True)
+        self._frames = []
+        return df
+
+
+class IngestStream:
+    """Writable stream of an uploaded file, saved to a temporary file, hashed and parsed.
+
+    Once the upload is complete, `save` moves the file to its final path and caches the
+    parsed data frame. Files that don't pass the headers check are not written further.
+    """
+
+    def __init__(self, folder: str, dt_col_name: str, check=None, cache=None):  # noqa
+        os.makedirs(folder, exist_ok=True)
+        self.file = tempfile.NamedTemporaryFile(dir=folder, prefix=".upload_", delete=False)
+        self.hash = hashlib.blake2b(digest_size=20)
+        self.parser = ProbeStreamParser(dt_col_name, check)
+        self.cache = cache or ParsedCache()
+
+    @property
+    def errors(self):
+        return self.parser.errors
+
+    def write(self, data: bytes):
+        if self.parser.failed:
+            return len(data)
+        self.hash.update(data)
+        self.parser.feed(data)
+        return self.file.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+    def save(self, dst: str):
+        """Move the uploaded file to dst and cache its parsed data, if it could be parsed."""
+        self.file.close()
+        os.replace(self.file.name, dst)
+        df = self.parser.close()
+        if df is None:
+            return
+        digest = self.hash.hexdigest()
+        remember_hash(dst, digest)
+        self.cache.put(self.cache.key(digest, self.parser.dt_col_name), df)
+
+    def discard(self):
+        self.file.close()
+        if os.path.exists(self.file.name):
+            os.remove(self.file.name)
+
+
+def save_upload(file_, dst: str):
+    """Save an uploaded file, returning its headers errors, if any.
+
+    Files that weren't ingested while uploading have their headers checked once saved.
+    """
+    if isinstance(file_.stream, IngestStream):
+        file_.stream.save(dst)
+        return file_.stream.errors
+    file_.save(dst)
+    check = checker(dst).match()
+    return None if check is True else list(check)
@@ -0,0 +1,151 @@
+"""Background jobs queue.
+
+Uploaded files are processed by a bounded amount of worker threads, one job at a time each,
+so many uploads at the same time never overload the system. Jobs state is persisted to a
+json file after every change, so queued jobs, and the ones that were running, are run again
+if the application restarts.
+"""
+import json
+import os
+import queue
+import threading
+import traceback
+import uuid
+from datetime import datetime
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+MAX_FINISHED_JOBS = 50  # Finished jobs kept on the jobs file
+
+
+def now():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+class Job:
+    """A unit of work with its arguments, state and progress."""
+
+    def __init__(self, args, id_=None, status=QUEUED, progress="", **times):  # noqa
+        self.id_ = id_ or uuid.uuid4().hex[:12]
+        self.args = args
+        self.status = status
+        self.progress = progress
+        self.error = times.pop("error", None)
+        self.metrics = times.pop("metrics", None)
+        self.created = times.get("created") or now()
+        self.started = times.get("started")
+        self.finished = times.get("finished")
+
+    def to_dict(self) -> dict:
+        return {
+            "id_": self.id_,
+            "args": self.args,
+            "status": self.status,
+            "progress": self.progress,
+            "error": self.error,
+            "metrics": self.metrics,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+        }
+
+
+class JobQueue:
+    """Queue of jobs run by a fixed amount of background worker threads.
+
+    target: function called with the job arguments as keyword arguments, plus the job
+        itself as `job`, in order to report its progress through `JobQueue.progress`.
+    path: json file where jobs are persisted.
+    on_change: optional function called with the queue after every job state change.
+    """
+
+    def __init__(self, target, path, workers=1, on_change=None):  # noqa
+        self.target = target
+        self.path = path
+        self.workers = workers
+        self.on_change = on_change
+        self.jobs = {}
+        self._pending = queue.Queue()
+        self._lock = threading.Lock()
+        self._threads = []
+        self.load()
+
+    def load(self):
+        """Load persisted jobs and queue again the unfinished ones."""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path) as f:
+            for data in json.load(f):
+                job = Job(**data)
+                if job.status in (QUEUED, RUNNING):
+                    job.status, job.started = QUEUED, None
+                    self._pending.put(job.id_)
+                self.jobs[job.id_] = job
+
+    def persist(self):
+        """Write all jobs to the jobs file, replacing it at once."""
+        finished = [j for j in self.jobs.values() if j.status in (DONE, FAILED)]
+        for job in finished[:-MAX_FINISHED_JOBS]:
+            del self.jobs[job.id_]
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump([job.to_dict() for job in self.jobs.values()], f)
+        os.replace(tmp, self.path)
+
+    def start(self):
+        """Start the worker threads, if not started yet."""
+        with self._lock:
+            for _ in range(self.workers - len(self._threads)):
+                t = threading.Thread(target=self._work, daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def submit(self, **args) -> Job:
+        """Add a new job to the queue."""
+        job = Job(args)
+        self._update(job, status=QUEUED, register=True)
+        self._pending.put(job.id_)
+        return job
+
+    def progress(self, job, msg, metrics=None):
+        """Update the progress message, and optionally the metrics, of a running job."""
+        if metrics is None:
+            self._update(job, progress=msg)
+        else:
+            self._update(job, progress=msg, metrics=metrics)
+
+    @property
+    def active(self) -> bool:
+        """Check if there is any job queued or running."""
+        with self._lock:
+            return any(job.status in (QUEUED, RUNNING) for job in self.jobs.values())
+
+    def to_list(self) -> list:
+        """All jobs information, the most recent first."""
+        with self._lock:
+            return [job.to_dict() for job in self.jobs.values()][::-1]
+
+    def _update(self, job, register=False, **fields):
+        with self._lock:
+            if register:
+                self.jobs[job.id_] = job
+            for k, v in fields.items():
+                setattr(job, k, v)
+            self.persist()
+        if self.on_change:
+            self.on_change(self)
+
+    def _work(self):
+        while True:
+            job = self.jobs.get(self._pending.get())
+            if job is None:
+                continue
+            self._update(job, status=RUNNING, started=now())
+            try:
+                self.target(job=job, **job.args)
+            except Exception:
+                self._update(job, status=FAILED, error=traceback.format_exc(), finished=now())
+            else:
+                self._update(job, status=DONE, finished=now())
@@ -0,0 +1,121 @@
+"""Pump events journal.
+
+Every pump switch is appended to a SQLite database as a structured event, with the time it
+happened, the program mode and loop, and how long the pump was planned to run and actually
+ran. Events are only ever inserted, by a single writer thread that commits them in batches,
+and queried by time range through the timestamp index.
+"""
+import atexit
+import queue
+import sqlite3
+import threading
+import time
+import traceback
+
+BATCH_SIZE = 50  # Events committed at once
+COMMIT_INTERVAL = 5.0  # Maximum seconds an event waits to be committed
+MAX_EVENTS = 10000  # Events returned by a query
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pump_events (
+    id INTEGER PRIMARY KEY,
+    timestamp REAL NOT NULL,
+    event TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    loop INTEGER,
+    planned REAL,
+    actual REAL
+);
+CREATE INDEX IF NOT EXISTS pump_events_timestamp ON pump_events (timestamp);
+"""
+COLUMNS = ("timestamp", "event", "mode", "loop", "planned", "actual")
+INSERT = f"INSERT INTO pump_events ({', '.join(COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?)"
+
+
+class PumpJournal:
+    """Append only journal of the pump events.
+
+    Timestamps are unix times, and durations are seconds.
+    """
+
+    def __init__(self, path, batch_size=BATCH_SIZE, commit_interval=COMMIT_INTERVAL):  # noqa
+        self.path = path
+        self.batch_size = batch_size
+        self.commit_interval = commit_interval
+        self._events = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        db = self.connect()
+        try:
+            db.execute("PRAGMA journal_mode=WAL")  # Readers don't block the writer
+            db.executescript(SCHEMA)
+        finally:
+            db.close()
+
+    def connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def record(self, event, mode, loop=None, planned=None, actual=None, timestamp=None):
+        """Queue an event to be written."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._write, daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+        row = (timestamp or time.time(), event, mode, loop, planned, actual)
+        self._events.put(row)
+
+    def flush(self):
+        """Wait until all queued events are committed."""
+        if self._thread is not None:
+            done = threading.Event()
+            self._events.put(done)
+            done.wait(timeout=10)
+
+    def _write(self):
+        db = self.connect()
+        rows, done = [], []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                item = self._events.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if isinstance(item, threading.Event):
+                done.append(item)
+            elif item is not None:
+                rows.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.commit_interval
+            if item is None or done or len(rows) >= self.batch_size:
+                if rows:
+                    try:
+                        with db:
+                            db.executemany(INSERT, rows)
+                    except sqlite3.Error:
+                        traceback.print_exc()
+                for event in done:
+                    event.set()
+                rows, done = [], []
+                deadline = None
+
+    def events(self, start=None, end=None, limit=MAX_EVENTS) -> list:
+        """Get the events between the start and end times, both included, oldest first."""
+        query = f"SELECT {', '.join(COLUMNS)} FROM pump_events"
+        where, args = [], []
+        if start is not None:
+            where.append("timestamp >= ?")
+            args.append(start)
+        if end is not None:
+            where.append("timestamp <= ?")
+            args.append(end)
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        query += " ORDER BY timestamp LIMIT ?"
+        db = self.connect()
+        try:
+            rows = db.execute(query, args + [limit]).fetchall()
+        finally:
+            db.close()
+        return [dict(zip(COLUMNS, row)) for row in rows]
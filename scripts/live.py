@@ -0,0 +1,240 @@
+"""Live analysis of a probe file while the experiment is running.
+
+The probe file is tailed as it grows: only the new bytes are read and parsed, and the new
+records are appended to in memory typed columns. The close phase records of the current loop
+are added to running sums, from which the loop trendline is solved in closed form once its
+close phase ends. So every new record costs the same, no matter how long the experiment is.
+
+Loops are split as in `ExperimentCycle`, from the time of the first record, and each loop
+result has the same values as its `ResumeDataFrame` row.
+"""
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from scripts.converter import TEMP_COL
+from scripts.ingest import ProbeStreamParser
+from scripts.stats import COLS_NAME, R2AB
+from scripts.utils import config_from_file
+
+READ_SIZE = 1024 * 1024  # Maximum bytes read at once
+
+
+class GrowableArray:
+    """Typed array with amortized constant time appends."""
+
+    def __init__(self, dtype, capacity=4096):  # noqa
+        self._data = np.empty(capacity, dtype=dtype)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def values(self) -> np.ndarray:
+        return self._data[: self._size]
+
+    def extend(self, values):
+        end = self._size + len(values)
+        if end > len(self._data):
+            data = np.empty(max(end, 2 * len(self._data)), dtype=self._data.dtype)
+            data[: self._size] = self.values
+            self._data = data
+        self._data[self._size : end] = values
+        self._size = end
+
+
+class LoopSums:
+    """Running sums of the close phase records of a loop.
+
+    O2 values are summed relative to the first one, which keeps the sums precision.
+    """
+
+    def __init__(self, loop, start, x0, y0):  # noqa
+        self.loop = loop
+        self.start = start  # Time of the first close record
+        self.x0 = x0  # Time stamp code of the first close record
+        self.y0 = y0
+        self.n = 0
+        self.sx = self.sy = self.sxx = self.sxy = self.syy = 0.0
+        self.temp = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+
+    def add(self, time_stamp_code, o2, temp):
+        """Add close phase records to the sums."""
+        x = (time_stamp_code - self.x0) / 60  # as calculate_ox
+        y = o2 - self.y0
+        self.n += len(x)
+        self.sx += x.sum()
+        self.sy += y.sum()
+        self.sxx += (x * x).sum()
+        self.sxy += (x * y).sum()
+        self.syy += (y * y).sum()
+        self.temp += temp.sum()
+        self.min = min(self.min, o2.min())
+        self.max = max(self.max, o2.max())
+
+    def fit(self) -> R2AB:
+        n = self.n
+        sxx = self.sxx - self.sx * self.sx / n
+        sxy = self.sxy - self.sx * self.sy / n
+        syy = self.syy - self.sy * self.sy / n
+        with np.errstate(divide="ignore", invalid="ignore"):
+            b = np.float64(sxy) / sxx
+            a = self.y0 + (self.sy - b * self.sx) / n
+            rsquared = np.float64(sxy) ** 2 / (sxx * syy)
+        return R2AB(rsquared, a, b)
+
+
+class LiveExperiment:
+    """Incremental analysis of a probe file that is still being written.
+
+    on_loop: optional function called with the result of each loop once its close phase ends.
+    blank: control MO2 subtracted from the loops MO2.
+    """
+
+    def __init__(self, path, flush, wait, close, on_loop=None, blank=0.0, poll=1.0):  # noqa
+        self.path = path
+        self.flush = flush
+        self.wait = wait
+        self.close = close
+        self.on_loop = on_loop
+        self.blank = blank
+        self.poll = poll
+        config = config_from_file()
+        experiment_config = config["experiment_file_config"]
+        self.aqua_volume = config["file_cycle_config"]["aqua_volume"]
+        self.dt_col_name = experiment_config["DT_COL"]
+        self.time_stamp_code = experiment_config["TSCODE"]
+        self.O2_COL = experiment_config["O2_COL"]
+        self.temp_col = experiment_config.get("TEMP_COL", TEMP_COL)
+        self.phase_time = f"F{flush*60}/W{wait*60}/C{close*60}"
+        self.loop_time = np.timedelta64((flush + wait + close) * 60, "s")
+        self.close_offset = np.timedelta64((flush + wait) * 60, "s")
+        self.loops = []
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Start reading the file from the beginning."""
+        self.offset = 0
+        self.parser = ProbeStreamParser(self.dt_col_name, block_size=1)
+        self.columns = {
+            self.dt_col_name: GrowableArray("datetime64[ns]"),
+            self.time_stamp_code: GrowableArray("float64"),
+            self.O2_COL: GrowableArray("float64"),
+            self.temp_col: GrowableArray("float64"),
+        }
+        self.first = None  # Time of the first record
+        self.current = None
+        with self._lock:
+            self.loops = []
+
+    @property
+    def rows(self) -> int:
+        return len(self.columns[self.dt_col_name])
+
+    def read(self) -> int:
+        """Read and analyze the records written since the last read."""
+        size = os.path.getsize(self.path)
+        if size < self.offset:  # The file was replaced
+            self.reset()
+        rows = self.rows
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            for chunk in iter(lambda: f.read(READ_SIZE), b""):
+                self.offset += len(chunk)
+                self.parser.feed(chunk)
+                for df in self.parser.frames():
+                    self.append(df)
+        if self.parser.failed:
+            raise ValueError(f"{self.path}: {', '.join(self.parser.errors)}")
+        if self.parser.parse_error:
+            raise ValueError(f"{self.path}: {self.parser.parse_error}")
+        return self.rows - rows
+
+    def append(self, df):
+        """Append new records to the columns and to their loops sums."""
+        for name, column in self.columns.items():
+            column.extend(df[name].values if name in df else np.full(len(df), np.nan))
+        times = df[self.dt_col_name].values
+        if not len(times):
+            return
+        if self.first is None:
+            self.first = times[0]
+        elapsed = times - self.first
+        loops = elapsed // self.loop_time
+        in_close = elapsed - loops * self.loop_time >= self.close_offset
+        # Records come sorted, so the records of each loop are contiguous
+        bounds = np.flatnonzero(np.diff(loops)) + 1
+        for rows in np.split(np.arange(len(times)), bounds):
+            loop = int(loops[rows[0]])
+            if self.current is not None and loop != self.current.loop:
+                self.finish()
+            rows = rows[in_close[rows]]
+            if not len(rows):
+                continue
+            time_stamp_code = df[self.time_stamp_code].values[rows]
+            o2 = df[self.O2_COL].values[rows]
+            if self.current is None:
+                self.current = LoopSums(loop, times[rows[0]], time_stamp_code[0], o2[0])
+            if self.temp_col in df:
+                temp = df[self.temp_col].values[rows]
+            else:
+                temp = np.full(len(rows), np.nan)
+            self.current.add(time_stamp_code, o2, temp)
+
+    def finish(self):
+        """Solve the current loop, once its close phase is complete."""
+        sums, self.current = self.current, None
+        if sums.n < 2:  # As in the loop index, loops without close data are discarded
+            return
+        rsquared, a, b = sums.fit()
+        slope = b * 60
+        mo2 = slope * self.aqua_volume
+        result = dict(
+            zip(
+                COLS_NAME,
+                [
+                    pd.Timestamp(sums.start).strftime("%d-%m-%Y %H:%M:%S"),
+                    sums.n + (self.flush + self.wait) * 60,
+                    sums.loop + 1,
+                    self.phase_time,
+                    mo2,
+                    slope,
+                    rsquared,
+                    sums.max,
+                    sums.min,
+                    sums.y0 + sums.sy / sums.n,
+                    sums.temp / sums.n,
+                    mo2 - self.blank,
+                ],
+            )
+        )
+        result = {k: v.item() if isinstance(v, np.generic) else v for k, v in result.items()}
+        with self._lock:
+            self.loops.append(result)
+        if self.on_loop is not None:
+            self.on_loop(result)
+
+    def run(self, stop: threading.Event):
+        """Tail the file until stopped."""
+        while True:
+            self.read()
+            if stop.wait(self.poll):
+                return
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            loops = list(self.loops)
+        return {
+            "path": self.path,
+            "flush": self.flush,
+            "wait": self.wait,
+            "close": self.close,
+            "rows": self.rows,
+            "loops": loops,
+        }
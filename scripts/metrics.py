@@ -0,0 +1,141 @@
+"""Processing stages metrics.
+
+The processing stages, like parsing or plotting, are timed with `stage`, which records the
+wall time, the rows processed and the peak resident memory of the process while the stage
+was running. Stages are recorded per thread and collected by the task that ran them, so they
+can travel back from the worker processes along with the task results.
+
+The kernel keeps the process memory peak since the process started, so the peak is reset
+when a stage starts, after adding the peak so far to the stages still running. Stages
+running at the same time on other threads of the process share their peaks. Where the peak
+can't be reset, as outside linux, stages have no peak memory.
+"""
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+Stage = namedtuple("Stage", "name seconds rows peak_rss")
+TOTALS = {"count": 0, "seconds": 0.0, "rows": 0, "peak_rss": 0}
+
+_local = threading.local()
+_running = []  # Peaks of the stages running on the process
+_peak_lock = threading.Lock()
+
+
+def peak_rss() -> int:
+    """Peak resident memory of the current process in bytes since the last reset."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024  # kB
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_rss() -> bool:
+    """Reset the process peak resident memory to the current one."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def update_peaks():
+    """Add the process peak so far to the peak of every running stage."""
+    peak = peak_rss() or 0
+    for info in _running:
+        if info["peak_rss"] is not None:
+            info["peak_rss"] = max(info["peak_rss"], peak)
+
+
+def recorded() -> list:
+    """Stages recorded on the current thread."""
+    if not hasattr(_local, "stages"):
+        _local.stages = []
+    return _local.stages
+
+
+@contextmanager
+def stage(name: str, rows: int = None):
+    """Time a processing stage.
+
+    Yields a dict where the rows processed can be set once they are known.
+    """
+    info = {"rows": rows, "peak_rss": 0}
+    with _peak_lock:
+        if _running:
+            update_peaks()
+        if not reset_peak_rss():
+            info["peak_rss"] = None
+        _running.append(info)
+    start = time.perf_counter()
+    try:
+        yield info
+    finally:
+        seconds = time.perf_counter() - start
+        with _peak_lock:
+            update_peaks()
+            _running[:] = [i for i in _running if i is not info]
+        recorded().append(Stage(name, seconds, info["rows"], info["peak_rss"]))
+
+
+def collect() -> list:
+    """Get and clear the stages recorded on the current thread."""
+    stages = recorded()[:]
+    recorded().clear()
+    return stages
+
+
+def measured(fn, *args, **kwargs):
+    """Run a task and return its result with the stages it recorded."""
+    collect()
+    return fn(*args, **kwargs), collect()
+
+
+def summary(stages: list) -> dict:
+    """Add up the stages by name."""
+    totals = {}
+    for s in stages:
+        total = totals.setdefault(s.name, dict(TOTALS))
+        total["count"] += 1
+        total["seconds"] += s.seconds
+        total["rows"] += s.rows or 0
+        total["peak_rss"] = max(total["peak_rss"], s.peak_rss or 0)
+    return totals
+
+
+class Metrics:
+    """Aggregated stages metrics of all processed jobs."""
+
+    def __init__(self):  # noqa
+        self.jobs = 0
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def add(self, stages: list):
+        """Add the stages of a finished job."""
+        with self._lock:
+            self.jobs += 1
+            for name, s in summary(stages).items():
+                total = self.stages.setdefault(name, dict(TOTALS, max_seconds=0.0))
+                total["count"] += s["count"]
+                total["seconds"] += s["seconds"]
+                total["max_seconds"] = max(total["max_seconds"], s["seconds"])
+                total["rows"] += s["rows"]
+                total["peak_rss"] = max(total["peak_rss"], s["peak_rss"])
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            stages = {}
+            for name, s in self.stages.items():
+                stages[name] = dict(
+                    s,
+                    mean_seconds=s["seconds"] / s["count"],
+                    rows_per_second=s["rows"] / s["seconds"] if s["seconds"] else None,
+                )
+            return {"jobs": self.jobs, "stages": stages}
@@ -0,0 +1,107 @@
+"""Probe file parser.
+
+The oxygen probe writes a .txt file with the instrument information on top (preamble)
+followed by a tab separated table with the experiment records.
+Here the table header line and the file encoding are found while scanning the raw bytes of
+the preamble, so the preamble is never tokenized, and then only the needed columns are read
+in a single pass of the pandas C engine.
+"""
+import codecs
+from collections import namedtuple
+from functools import partial
+
+import chardet
+import pandas as pd
+
+TOTAL_COLUMNS = 6  # Columns of information recorded by the probe
+MAX_PREAMBLE_LINES = 200  # Stop looking for the header after this amount of lines
+
+Header = namedtuple("Header", "line encoding columns")
+
+
+def detect_encoding(raw: bytes) -> str:
+    """Get the encoding of a chunk of raw bytes."""
+    if raw.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    try:
+        raw.decode("utf-8")
+        return "utf-8"
+    except UnicodeDecodeError:
+        return chardet.detect(raw)["encoding"] or "latin-1"
+
+
+def is_header(line: bytes, key: bytes) -> bool:
+    """Check if a raw line is the table header, the one starting with the date time column."""
+    first_column = line.split(b"\t", 1)[0].strip()
+    return first_column.replace(codecs.BOM_UTF8, b"") == key
+
+
+def make_header(raw: list) -> Header:
+    """Create the header from the raw lines of the preamble, the header line being the last."""
+    encoding = detect_encoding(b"".join(raw))
+    columns = raw[-1].decode(encoding).rstrip("\r\n").split("\t")
+    return Header(len(raw) - 1, encoding, columns[:TOTAL_COLUMNS])
+
+
+def read_header(file_: str, dt_col_name: str) -> Header:
+    """Find the table header of a probe file.
+
+    Returns the line number of the header, the file encoding and the table columns name.
+    The date time column name is used to identify the header line, as it is always the first
+    column of the table.
+    """
+    key = dt_col_name.encode("utf-8")
+    raw = []
+    with open(file_, "rb") as f:
+        for line_number, line in enumerate(f):
+            raw.append(line)
+            if is_header(line, key):
+                break
+            if line_number >= MAX_PREAMBLE_LINES:
+                raise ValueError(f"Column '{dt_col_name}' not found in {file_}")
+        else:
+            raise ValueError(f"Column '{dt_col_name}' not found in {file_}")
+    return make_header(raw)
+
+
+def parse_records(source, header: Header, skiprows: int = 0) -> pd.DataFrame:
+    """Parse the records table, from a file path or a file like object.
+
+    Except the date time column, all columns are numeric channels written with a decimal
+    comma, which are converted here to float columns.
+    """
+    usecols = list(range(len(header.columns)))
+    read_table = partial(
+        pd.read_csv,
+        source,
+        sep="\t",
+        header=None,
+        skiprows=skiprows,
+        usecols=usecols,
+        decimal=",",
+        encoding=header.encoding,
+        engine="c",
+    )
+    dtype = {i: "float64" for i in usecols}
+    dtype[0] = str
+    try:
+        df = read_table(dtype=dtype)
+    except ValueError:
+        # A channel has some value that is not a number, which is converted to NaN
+        if hasattr(source, "seek"):
+            source.seek(0)
+        df = read_table(dtype=str)
+        for i in usecols[1:]:
+            values = df[i].str.replace(",", ".", regex=False)
+            df[i] = pd.to_numeric(values, errors="coerce").astype("float64")
+    df.columns = header.columns
+    return df
+
+
+def read_probe_file(file_: str, dt_col_name: str) -> pd.DataFrame:
+    """Read the table of a probe file into a data frame.
+
+    The preamble and the header line are skipped, and only the probe columns are parsed.
+    """
+    header = read_header(file_, dt_col_name)
+    return parse_records(file_, header, skiprows=header.line + 1)
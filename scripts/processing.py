@@ -0,0 +1,79 @@
+"""Processing tasks of the uploaded experiment files.
+
+Each task handles a single file, from parsing to its reduced results, and it is meant to run
+on a pool of worker processes. Tasks return only the light results, so the parsed data never
+travels between processes. Tasks are run through `metrics.measured`, which sends back the
+stages metrics recorded while running them along with their results.
+"""
+import json
+import os
+
+from scripts import metrics
+from scripts.archive import ArchiveSink
+from scripts.converter import ControlFile, ExperimentCycle
+from scripts.file_cache import ResultsCache, cache_key, file_hash
+from scripts.stats import Control, ResumeDataFrame
+from scripts.utils import config_from_file
+
+
+def control_mo2(flush: int, wait: int, close: int, file_path: str) -> float:
+    """Calculate the mean MO2 of a control file.
+
+    The same control files are used for many experiments, so results are cached by the file
+    content and every value used to calculate them.
+    """
+    config = config_from_file()
+    key = cache_key(
+        file_hash(file_path),
+        flush,
+        wait,
+        close,
+        config["file_cycle_config"]["aqua_volume"],
+        json.dumps(config["experiment_file_config"], sort_keys=True),
+    )
+    cache = ResultsCache()
+    mo2 = cache.get(key)
+    if mo2 is None:
+        mo2 = Control(ControlFile(flush, wait, close, file_path)).get_bank()
+        cache.put(key, mo2)
+    return mo2
+
+
+def experiment_resume(flush, wait, close, file_path, archive, plot=False) -> ResumeDataFrame:
+    """Generate the resume of an experiment file, writing its loops data and plots.
+
+    The loops data and the plots go straight into the results archive, so the experiment is
+    loaded and split into loops only once. The resume is generated without blank, which must
+    be applied once all controls are done, to save it with `save_resume`.
+    """
+    experiment = ExperimentCycle(flush, wait, close, file_path)
+    resume = ResumeDataFrame(experiment)
+    resume.generate_resume(0)
+    with ArchiveSink(archive, mode="a") as sink:
+        resume.save_loops(sink)
+        if plot:
+            experiment.create_plot(sink=sink)
+            experiment.create_overview_plot(sink=sink)
+    return resume
+
+
+def save_resume(resume: ResumeDataFrame, archive: str):
+    """Write a resume straight into the results archive."""
+    with ArchiveSink(archive, mode="a") as sink:
+        resume.save(sink)
+
+
+def publish_archive(archive: str, folder: str, dst: str):
+    """Add the files left on the project folder, like the uploads, to the archive.
+
+    The archive is built under a temporary name and only moved to dst once complete.
+    """
+    with metrics.stage("zip"):
+        with ArchiveSink(archive, mode="a") as sink:
+            sink.add_folder(folder)
+        os.replace(archive, dst)
+
+
+def calculate_blank(values: list) -> float:
+    """Get the blank value from the mean MO2 of all controls."""
+    return sum(values) / len(values)
@@ -0,0 +1,95 @@
+"""Pump program scheduler.
+
+Every pump switch has an absolute deadline computed from a single monotonic start time,
+loop n flush starting at start + n * (flush + wait + close). The work done on each switch,
+like updating the state or logging, doesn't delay the next deadline, so the pump schedule
+never drifts from the loop phases the analysis assumes, no matter how long the program runs.
+The delay of each switch from its deadline is recorded as its jitter.
+"""
+import time
+from collections import deque, namedtuple
+
+HISTORY = 100  # Loops timing kept
+
+Timing = namedtuple("Timing", "loop on_jitter off_jitter")  # seconds late
+
+
+class PumpScheduler:
+    """Run the pump loops on schedule until stopped.
+
+    flush: seconds the pump is on each loop.
+    rest: seconds the pump is off each loop, wait and close phases.
+    stop: event that stops the program once set.
+    """
+
+    def __init__(self, flush, rest, stop, clock=time.monotonic):  # noqa
+        self.flush = flush
+        self.rest = rest
+        self.loop_time = flush + rest
+        self.stop = stop
+        self.clock = clock
+        self.start = None
+        self.skipped = 0
+        self.timings = deque(maxlen=HISTORY)
+
+    def deadlines(self, loop):
+        """Monotonic times when the pump must be switched on and off on a loop."""
+        on = self.start + loop * self.loop_time
+        return on, on + self.flush
+
+    def wall_time(self, deadline) -> float:
+        """Wall clock time of a monotonic deadline."""
+        return time.time() + deadline - self.clock()
+
+    def wait_until(self, deadline) -> bool:
+        """Wait until the deadline, returning False if stopped before."""
+        while True:
+            remaining = deadline - self.clock()
+            if remaining <= 0:
+                return True
+            if self.stop.wait(remaining):
+                return False
+
+    def run(self, pump_cycle):
+        """Call pump_cycle(loop, on) when the pump must be switched on and off.
+
+        Loops are numbered from 1. A loop whose flush time has completely passed, as after
+        the board was suspended, is skipped instead of being run late, while a loop that is
+        still on its flush time is run for what is left of it. If stopped during a flush,
+        pump_cycle(loop, False) is still called so the pump isn't left on.
+        """
+        self.start = self.clock()
+        loop = 0
+        while self.wait_until(self.deadlines(loop)[0]):
+            on, off = self.deadlines(loop)
+            now = self.clock()
+            if now >= off:
+                current = int((now - self.start) // self.loop_time)
+                if now >= self.deadlines(current)[1]:
+                    current += 1
+                self.skipped += current - loop
+                loop = current
+                continue
+            pump_cycle(loop + 1, True)
+            if not self.wait_until(off):
+                pump_cycle(loop + 1, False)
+                return
+            off_jitter = self.clock() - off
+            self.timings.append(Timing(loop + 1, now - on, off_jitter))
+            pump_cycle(loop + 1, False)
+            loop += 1
+
+    def timing(self) -> dict:
+        """Switches jitter of the last loops, in milliseconds."""
+        jitters = [abs(j) for t in self.timings for j in (t.on_jitter, t.off_jitter)]
+        if not jitters:
+            return {"loops": 0, "skipped": self.skipped}
+        last = self.timings[-1]
+        return {
+            "loops": last.loop,
+            "skipped": self.skipped,
+            "last_on_jitter": round(last.on_jitter * 1000, 3),
+            "last_off_jitter": round(last.off_jitter * 1000, 3),
+            "mean_jitter": round(sum(jitters) / len(jitters) * 1000, 3),
+            "max_jitter": round(max(jitters) * 1000, 3),
+        }
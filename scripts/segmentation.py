@@ -0,0 +1,80 @@
+"""Experiment loops segmentation.
+
+An experiment is a sequence of loops and each loop is made of three phases: flush, wait and
+close. Here the boundaries of every phase are calculated from the records timestamps, so
+sample gaps or multi-day recordings never shift the loops, as happens when the records are
+counted assuming one record per second.
+"""
+import math
+
+import numpy as np
+
+PHASES = ["flush", "wait", "close"]
+
+
+class LoopIndex:
+    """Rows boundaries of the flush, wait and close phases of every experiment loop.
+
+    times: sorted datetime64 values of the experiment records.
+    flush, wait, close: phases duration in minutes.
+
+    `bounds` keeps the timestamps where each phase starts plus the loop end time, and `rows`
+    the position of the first record at or after each one of them. Both have a row per loop
+    and a column per phase boundary. All rows are found with a single searchsorted call.
+    Loops without at least two records in the close phase can't be analyzed and are left out,
+    so `loops` keeps the real number of each indexed loop.
+    """
+
+    def __init__(self, times, flush: int, wait: int, close: int):  # noqa
+        times = np.asarray(times, dtype="datetime64[ns]")
+        offsets = np.cumsum([0, flush, wait, close]) * 60
+        offsets = np.round(offsets * 1e9).astype("timedelta64[ns]")
+        loop_time = offsets[-1]
+        if len(times) and loop_time > np.timedelta64(0, "ns"):
+            total = math.ceil((times[-1] - times[0]) / loop_time)
+        else:
+            total = 0
+        starts = times[0] + np.arange(total) * loop_time if total else times[:0]
+        bounds = starts[:, np.newaxis] + offsets[np.newaxis, :]
+        rows = np.searchsorted(times, bounds.ravel(), side="left").reshape(bounds.shape)
+
+        close_records = rows[:, 3] - rows[:, 2]
+        keep = close_records >= 2
+        self.loops = np.arange(1, total + 1)[keep]
+        self.bounds = bounds[keep]
+        self.rows = rows[keep]
+
+    def __len__(self):
+        return len(self.loops)
+
+    def _column(self, phase: str) -> int:
+        return PHASES.index(phase)
+
+    def slices(self, phase: str = "close") -> list:
+        """Get the rows slice of the given phase for every loop."""
+        i = self._column(phase)
+        return [slice(start, end) for start, end in self.rows[:, i : i + 2]]
+
+    def members(self, phase: str = "close"):
+        """Get the rows of the given phase of all loops at once.
+
+        Returns the loop position in the index of each row, and the rows position.
+        """
+        i = self._column(phase)
+        starts = self.rows[:, i]
+        lengths = self.rows[:, i + 1] - starts
+        labels = np.repeat(np.arange(len(lengths)), lengths)
+        offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        return labels, starts[labels] + offsets
+
+    def ranges(self, phase: str = None) -> dict:
+        """Create the time ranges of the given phase, or of the complete loop, for every loop."""
+        if phase is None:
+            first, last = 0, -1
+        else:
+            first = self._column(phase)
+            last = first + 1
+        return {
+            int(k): {"start": self.bounds[i, first], "end": self.bounds[i, last]}
+            for i, k in enumerate(self.loops)
+        }
@@ -0,0 +1,55 @@
+"""System state shared with the browser clients.
+
+A single versioned snapshot of the pump and files processing state. Every update bumps the
+version and sends only the changed fields to the clients, which apply them to their copy of
+the snapshot. A client that misses a version fetches the whole snapshot again, which is
+served with the version as ETag, so revalidating an unchanged state costs a 304.
+"""
+import threading
+import uuid
+
+STATUS = {
+    "running": False,
+    "run_auto": False,
+    "run_manual": False,
+    "started_at": None,
+    "cycle_ends_in": None,
+    "next_cycle_at": None,
+    "generating_files": False,
+    "total_loops": 0,
+    "auto_run_since": None,
+    "pump_timing": None,  # Switches jitter of the automatic program
+}
+
+
+class SystemState:
+    """Versioned snapshot of the system state.
+
+    on_change: optional function called with the new version and the changed fields, in the
+        order the updates happen.
+    """
+
+    def __init__(self, on_change=None, **initial):  # noqa
+        self._state = dict(STATUS, **initial)
+        self.version = 0
+        self.on_change = on_change
+        self.boot = uuid.uuid4().hex[:8]  # Versions restart with the process
+        self._lock = threading.RLock()
+
+    def __getitem__(self, key):
+        return self._state[key]
+
+    def update(self, **changes) -> dict:
+        """Change the state at once, returning the fields that actually changed."""
+        with self._lock:
+            diff = {k: v for k, v in changes.items() if self._state.get(k) != v}
+            if diff:
+                self._state.update(diff)
+                self.version += 1
+                if self.on_change is not None:
+                    self.on_change(self.version, diff)
+            return diff
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self._state, version=self.version)
@@ -4,19 +4,19 @@ Here we handle the raw information from the whole experiment and generate a resu
 the information of each experiment loop.
 """
 
-import datetime
 import os
 import shutil
 from functools import namedtuple
 
-import statsmodels.api as sm
+import numpy as np
 import pandas as pd
 
-from scripts.utils import string_to_float, delete_excel_files, config_from_file
+from scripts import metrics
+from scripts.export import StreamingWorkbook
+from scripts.utils import delete_excel_files, config_from_file
 
 ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # app root dir
 print("STSTAS FILE", ROOT)
-O2Data = namedtuple("O2Data", "min max avg")
 R2AB = namedtuple("R2AB", "rsquared a b")
 COLS_NAME = [
     "Date &Time [DD-MM-YYYY HH:MM:SS]",
@@ -34,36 +34,37 @@ COLS_NAME = [
 ]
 
 
+def trendlines(x, y, labels) -> R2AB:
+    """Calculate R squared, a and b values of many data sets at once.
 
-
-def temp_mean(series):
-    """Get a pandas series and calculate the mean.
-
-    Series row values are float values in string format separated by ",".
+    x and y have the values of all data sets one after the other, and labels the number of
+    the data set (0, 1, ...) of each value. The ordinary least squares fit of every data set
+    is solved in closed form from its grouped sums, all data sets in a single pass.
+    Returns a R2AB with an array of values per field, one value per data set.
     """
-    return series.map(string_to_float).mean()
-
-
-def O2_data(series):
-    """O2 calculations."""
-    min_ = series.map(string_to_float).min()
-    max_ = series.map(string_to_float).max()
-    avg_ = series.map(string_to_float).mean()
-    return O2Data(min_, max_, avg_)
+    x = np.asarray(x, dtype="float64")
+    y = np.asarray(y, dtype="float64")
+    total = labels.max() + 1 if len(labels) else 0
+    n = np.bincount(labels, minlength=total)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x_mean = np.bincount(labels, x, total) / n
+        y_mean = np.bincount(labels, y, total) / n
+        # Centered sums keep precision when values are far away from zero
+        dx = x - x_mean[labels]
+        dy = y - y_mean[labels]
+        sxx = np.bincount(labels, dx * dx, total)
+        sxy = np.bincount(labels, dx * dy, total)
+        syy = np.bincount(labels, dy * dy, total)
+        b = sxy / sxx
+        a = y_mean - b * x_mean
+        rsquared = sxy ** 2 / (sxx * syy)
+    return R2AB(rsquared, a, b)
 
 
 def trendline_data(df_close, x_column, y_column):
     """Calculate R squared, a and b values."""
-    x = df_close[x_column]
-    y = df_close[y_column]
-    x = sm.add_constant(x)
-    model = sm.OLS(y, x)
-    results = model.fit()
-    # Values
-    rsquared = results.rsquared
-    a = results.params[0]
-    b = results.params[1]
-    return R2AB(rsquared, a, b)
+    fit = trendlines(df_close[x_column], df_close[y_column], np.zeros(len(df_close), int))
+    return R2AB(*(values[0] for values in fit))
 
 
 class ResumeDataFrame:
@@ -74,6 +75,13 @@ class ResumeDataFrame:
         self.original_df = experiment.df
         self.experiment = experiment
         self.dt_col_name = experiment.dt_col_name
+        # Output location, kept apart from the experiment to save the resume without it
+        self.file_output = experiment.original_file.file_output
+        self.output = experiment.original_file.output
+        self.save_loop_df = experiment.save_loop_df
+        self.phases = (experiment.flush, experiment.wait, experiment.close)
+        self.original_file = experiment.original_file.file_
+        self.loop_sheets = experiment.loop_sheets
         self.df_lists = []
         self.phase_time = (
             f"F{experiment.flush*60}/W{experiment.wait*60}/C{experiment.close*60}"  # noqa
@@ -82,67 +90,159 @@ class ResumeDataFrame:
     @property
     def loop_data_range(self) -> dict:
         """Create a time ranges of each complete loop of the experiment."""
-        loop_range = {}
-        start = self.original_df[self.dt_col_name].iloc[0]
-        for i in range(self.experiment.total_of_loops):
-            end = start + datetime.timedelta(minutes=self.experiment.loop_time)
-            loop_range[i + 1] = {"start": start, "end": end}
-            start = end + datetime.timedelta(minutes=self.experiment.loop_time)
-        return loop_range
+        return self.experiment.loop_data_range
 
     def generate_resume(self, control):
-        """Create a the daily experiment resume."""
-        resume_df = pd.DataFrame(columns=COLS_NAME)
+        """Create a the daily experiment resume.
+
+        All close phase rows are labelled with their loop and aggregated at once, and the fit
+        of every loop is taken from the experiment, so the resume is built in one go.
+        """
+        with metrics.stage("resume", len(self.original_df)):
+            self._generate_resume(control)
+
+    def _generate_resume(self, control):
+        experiment = self.experiment
         config = config_from_file()
         aqua_volume = config["file_cycle_config"]["aqua_volume"]
-        for i, df_close in enumerate(self.experiment.df_close_list):
-            # for k, v in self.loop_data_range.items():
-            k = i + 1
-            O2_col_name = "SDWA0003000061      , CH 1 O2 [mg/L]"
-            # O2_col_name = "SDWA0003000061      , CH 1 O2 [% air saturation]"
-
-            O2 = O2_data(df_close[O2_col_name])
-            r2_a_b = trendline_data(df_close, self.experiment.x, self.experiment.y)
-            slope = r2_a_b.b * 60
-            O2_HR = slope * aqua_volume
-
-            row = {
-                "Date &Time [DD-MM-YYYY HH:MM:SS]": df_close[
-                    "Date &Time [DD-MM-YYYY HH:MM:SS]"
-                ][0],
-                "Time [sec]": len(df_close) + (self.experiment.discard_time * 60),
-                "Loop": k,
+        loop_index = experiment.loop_index
+        labels, rows = loop_index.members("close")
+        df = experiment.df
+        close = pd.DataFrame(
+            {
+                "loop": labels,
+                "O2": df[experiment.O2_COL].values[rows],
+                "temp": df[experiment.temp_col].values[rows],
+            }
+        )
+        grouped = close.groupby("loop", sort=True)
+        O2 = grouped["O2"].agg(["min", "max", "mean"])
+        temp = grouped["temp"].mean()
+
+        r2_a_b = experiment.fits
+        slope = r2_a_b.b * 60
+        O2_HR = slope * aqua_volume
+        first_rows = loop_index.rows[:, 2]
+        close_records = loop_index.rows[:, 3] - first_rows
+
+        resume_df = pd.DataFrame(
+            {
+                "Date &Time [DD-MM-YYYY HH:MM:SS]": df[self.dt_col_name].values[first_rows],
+                "Time [sec]": close_records + (experiment.discard_time * 60),
+                "Loop": loop_index.loops,
                 "Phase time [s]": self.phase_time,
                 "CH 1 MO2 [mgO2/hr]": O2_HR,
                 "CH 1 slope [mgO2/L/hr]": slope,
                 "CH 1 R^2": r2_a_b.rsquared,
-                "CH 1 max O2 [mgO2/L]": O2.max,
-                "CH 1 min O2 [mgO2/L]": O2.min,
-                "CH 1 avg O2 [mgO2/L]": O2.avg,
-                "CH 1 avg temp [°C]": temp_mean(
-                    df_close["SDWA0003000061      , CH 1 temp [°C]"]
-                ),
+                "CH 1 max O2 [mgO2/L]": O2["max"].values,
+                "CH 1 min O2 [mgO2/L]": O2["min"].values,
+                "CH 1 avg O2 [mgO2/L]": O2["mean"].values,
+                "CH 1 avg temp [°C]": temp.values,
                 "O2 after blank": O2_HR - control,
-            }
+            },
+            columns=COLS_NAME,
+            index=loop_index.loops,
+        )
+        self.resume_df = resume_df
 
-            resume_df.loc[k] = row
+    def __getstate__(self):
+        """Leave the experiment data out when the resume is sent to another process."""
+        state = self.__dict__.copy()
+        state.update(experiment=None, original_df=None)
+        return state
 
-        self.resume_df = resume_df
+    def apply_blank(self, control):
+        """Subtract the control blank value from the experiment MO2."""
+        self.resume_df["O2 after blank"] = self.resume_df["CH 1 MO2 [mgO2/hr]"] - control
+
+    def save(self, sink=None):
+        """Save the resume into the project folder, with the loops data if required, and zip it.
+
+        sink: optional archive where the resume alone is written straight away instead, as the
+            loops data is saved on its own with `save_loops`.
+        """
+        with metrics.stage("save", len(self.resume_df)):
+            self._save(sink)
+        if sink is None:
+            self.save_loops()
+            self.zip_folder()
+
+    def _save(self, sink):
+        ext = self.output
+        if sink is None:
+            fname = f"{self.file_output}.{ext}"
+            if ext == "csv":
+                self.resume_df.to_csv(fname)
+            else:
+                self.save_workbook(fname)
+            return
+
+        fname = f"{os.path.basename(self.file_output)}.{ext}"
+        with sink.open(fname, text=ext == "csv") as f:
+            if ext == "csv":
+                self.resume_df.to_csv(f)
+            else:
+                self.save_workbook(f)
+
+    def save_workbook(self, fname):
+        """Write the resume into a workbook.
+
+        fname: workbook file path or writable binary stream.
+        """
+        with StreamingWorkbook(fname) as workbook:
+            workbook.add_sheet("Resum", self.resume_df)
 
-    def save(self):
-        ext = self.experiment.original_file.output
-        fname = f"{self.experiment.original_file.file_output}.{ext}"
-        if ext == "csv":
-            self.resume_df.to_csv(fname)
-        else:
-            self.resume_df.to_excel(fname)
+    def save_loops(self, sink=None):
+        """Save the close phase data of every loop into its own workbook, if required.
 
-        self.zip_folder()
+        sink: optional archive where the workbook is written, instead of the project folder.
+        """
+        if not self.save_loop_df:
+            return
+        close_rows = self.experiment.loop_index.rows[:, 2:]
+        rows = int((close_rows[:, 1] - close_rows[:, 0]).sum())
+        with metrics.stage("save", rows):
+            if sink is None:
+                self.save_loops_workbook(f"{self.file_output}_loops.xlsx")
+                return
+            with sink.open(f"{os.path.basename(self.file_output)}_loops.xlsx") as f:
+                self.save_loops_workbook(f)
+
+    def save_loops_workbook(self, fname):
+        """Write the close phase data of every loop into a workbook.
+
+        fname: workbook file path or writable binary stream.
+
+        Loops are written one per sheet or, with loop_sheets "single", all into one sheet
+        with a Loop column. The data of each loop is built only while it is written, so a
+        single loop is kept in memory at once.
+        """
+        experiment = self.experiment
+        loop_index = experiment.loop_index
+        loops = (
+            (k, experiment._close_df(rows))
+            for k, rows in zip(loop_index.loops, loop_index.slices("close"))
+        )
+        with StreamingWorkbook(fname) as workbook:
+            if self.loop_sheets == "single":
+                sheet = None
+                for k, df_close in loops:
+                    if sheet is None:
+                        sheet = workbook.add_sheet("Loops", df_close, False, ("Loop", k))
+                    else:
+                        workbook.append(sheet, df_close, index=False, extra=("Loop", k))
+            else:
+                for k, df_close in loops:
+                    workbook.add_sheet(f"Loop {k}", df_close)
 
     def zip_folder(self):
         """Zip the most recent folder created with excel files."""
+        with metrics.stage("zip"):
+            self._zip_folder()
+
+    def _zip_folder(self):
         # Full path of the project folder name
-        location = os.path.dirname(os.path.abspath(self.experiment.original_file.file_output))
+        location = os.path.dirname(os.path.abspath(self.file_output))
 
         # Same as app.config["ZIP_FOLDER"]
         ZIP_FOLDER = os.path.abspath(f"{ROOT}/static/uploads/zip_files")
@@ -155,14 +255,9 @@ class ResumeDataFrame:
 
 
 class Control(ResumeDataFrame):
-    values = []
+    """Resume of a control file, used to calculate the experiment blank."""
 
-    def get_bank(self):
+    def get_bank(self) -> float:
+        """Calculate the control mean MO2."""
         self.generate_resume(0)
-        self.values.append(
-            self.resume_df["CH 1 MO2 [mgO2/hr]"].sum()
-            / len(self.resume_df["CH 1 MO2 [mgO2/hr]"])
-        )
-
-    def calculate_blank(self):
-        return sum(self.values) / len(self.values)
+        return float(self.resume_df["CH 1 MO2 [mgO2/hr]"].mean())
@@ -3,8 +3,10 @@
 All the operations here must be independent of the application requests.
 """
 
+import copy
 import shutil
 import os
+import threading
 import time
 import json
 from datetime import datetime, timedelta
@@ -14,7 +16,12 @@ import chardet
 
 import plotly.express as px
 
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # app root dir
+CONFIG_FILE = os.path.join(ROOT, "config.json")
 SUPPORTED_FILES = ["txt", "xlsx"]
+# Date time formats written by the probe. The last one is only for testing.
+DT_FORMATS = ["%d/%m/%Y %H:%M:%S", "%d-%m-%Y %H:%M:%S", "%Y-%m-%d %H:%M:%S"]
+LOOP_SHEETS = ["per_loop", "single"]  # Loops data saved one per sheet or all in one sheet
 
 
 def string_to_float(n: str) -> float:
@@ -71,7 +78,7 @@ def file_formatter(file_):
     dt_col_name = "Date &Time [DD-MM-YYYY HH:MM:SS]"
     # if not (dt_col_name in df.columns): TODO: Must create a column name checker
     #     return f"File is missing a column with name {dt_col_name}"
-    df[dt_col_name] = df[dt_col_name].map(convert_datetime)
+    df[dt_col_name] = to_datetime_column(df[dt_col_name])
     folder_dst = os.path.dirname(file_)
     fname = os.path.basename(file_).split(".")[0]
 
@@ -137,9 +144,34 @@ def to_js_time(value=None, run_type="auto"):
     return int(time.mktime(now.timetuple()) * 1000)
 
 
-def convert_datetime(dt: str):
-    """Convert a date time str representation to a python datetime object."""
-    return datetime.strptime(dt, "%d/%m/%Y %H:%M:%S")
+def to_timestamp(value: str = None) -> float:
+    """Convert a unix timestamp or an ISO date time str representation to a unix timestamp."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def datetime_format(dt: str) -> str:
+    """Find which one of the supported formats matches a date time str representation."""
+    for format_ in DT_FORMATS:
+        try:
+            datetime.strptime(dt.strip(), format_)
+            return format_
+        except ValueError:
+            continue
+    raise ValueError(f"Unsupported date time format: '{dt}'")
+
+
+def to_datetime_column(series):
+    """Convert a column of date time str representations to a datetime64 column.
+
+    The format is detected once from the first value and then applied to the whole column in
+    a single vectorized conversion.
+    """
+    return pd.to_datetime(series, format=datetime_format(series.iloc[0]))
 
 
 def check_extensions(ext):
@@ -150,11 +182,46 @@ def check_extensions(ext):
         return False
 
 
+class ConfigFile:
+    """Application configuration file.
+
+    The configuration is loaded once and kept in memory. Every read only checks the file
+    modification time, and the file is loaded again if it changed. Readers get a copy of the
+    configuration, so they can't change the loaded one.
+    """
+
+    def __init__(self, path=CONFIG_FILE):  # noqa
+        self.path = path
+        self._config = None
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def load(self) -> dict:
+        mtime = os.stat(self.path).st_mtime_ns
+        with self._lock:
+            if mtime != self._mtime:
+                with open(self.path) as f:
+                    self._config = json.load(f)
+                self._mtime = mtime
+            return copy.deepcopy(self._config)
+
+    def save(self, config: dict):
+        """Write the configuration, replacing the file at once."""
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(config, f)
+        os.replace(tmp, self.path)
+        with self._lock:
+            self._config = copy.deepcopy(config)
+            self._mtime = os.stat(self.path).st_mtime_ns
+
+
+config_file = ConfigFile()
+
+
 def config_from_file():
-    """Open config file."""
-    with open("config.json") as f:
-        config = json.load(f)
-    return config
+    """Get the application configuration."""
+    return config_file.load()
 
 
 def save_config_to_file(new_config):
@@ -165,8 +232,9 @@ def save_config_to_file(new_config):
         except ValueError:
             return value.strip()
 
+    # Experiment file settings missing from the form keep their current value
     config_keys = {
-        "experiment_file_config": {},
+        "experiment_file_config": config_from_file()["experiment_file_config"],
         "file_cycle_config": {},
         "pump_control_config": {},
     }
@@ -189,6 +257,8 @@ def save_config_to_file(new_config):
                 config_keys["file_cycle_config"].update({k: string_to_int(v)})
         else:
             print(f"Unexpected value {k}: {v}")
+    if config_keys["experiment_file_config"].get("LOOP_SHEETS") not in LOOP_SHEETS:
+        config_keys["experiment_file_config"]["LOOP_SHEETS"] = LOOP_SHEETS[0]
     config_keys["experiment_file_config"].update(
         {"SAVE_LOOP_DF": True if new_config.get("save_loop_df") else False}
     )
@@ -196,10 +266,5 @@ def save_config_to_file(new_config):
         {"SAVE_CONVERTED": True if new_config.get("save_converted") else False}
     )
 
-    with open("config.json", "w") as f:
-        json.dump(config_keys, f)
+    config_file.save(config_keys)
     return config_keys
-
-
-def calculate_blank(df):
-    pass
@@ -0,0 +1,87 @@
+"""Benchmarks of the conversion pipeline stages.
+
+Synthetic 1 Hz probe recordings are generated once per session at the selected scales:
+
+    python -m pytest tests/benchmarks --bench-scale=day,week,month
+
+or with the RESPI_BENCH_SCALE environment variable. Runs are saved under
+tests/benchmarks/.benchmarks and compared against the latest saved run, so regressions show up
+on the next run. Requires pytest-benchmark.
+"""
+import os
+
+import pytest
+
+from scripts.generator import COLUMNS, generate_probe_file
+
+STORAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".benchmarks")
+SCALES = {"day": 24 * 3600, "week": 7 * 24 * 3600, "month": 30 * 24 * 3600}  # seconds
+ROUNDS = {"day": 5, "week": 3, "month": 1}
+LOOP = (3, 2, 20)  # flush, wait, close minutes
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--bench-scale",
+        default=os.environ.get("RESPI_BENCH_SCALE", "day"),
+        help=f"Comma separated recording lengths to benchmark: {', '.join(SCALES)}",
+    )
+
+
+def pytest_configure(config):
+    """Save every run and compare it with the previous one, unless told otherwise."""
+    if not config.pluginmanager.hasplugin("benchmark"):
+        return
+    from pytest_benchmark.utils import get_tag
+
+    option = config.option
+    if option.benchmark_storage == "file://./.benchmarks":  # the plugin default
+        option.benchmark_storage = f"file://{STORAGE}"
+    if not option.benchmark_save:
+        option.benchmark_autosave = get_tag()
+    if not option.benchmark_compare:
+        option.benchmark_compare = True
+
+
+def pytest_generate_tests(metafunc):
+    if "scale" in metafunc.fixturenames:
+        scales = metafunc.config.getoption("bench_scale").split(",")
+        unknown = set(scales) - set(SCALES)
+        if unknown:
+            raise pytest.UsageError(f"Unknown benchmark scale {', '.join(unknown)}")
+        metafunc.parametrize("scale", scales, scope="session")
+
+
+@pytest.fixture(scope="session")
+def dt_col():
+    return COLUMNS[0]
+
+
+@pytest.fixture(scope="session")
+def loop():
+    return LOOP
+
+
+@pytest.fixture(scope="session")
+def rounds(scale):
+    return ROUNDS[scale]
+
+
+@pytest.fixture(scope="session")
+def probe_file(scale, tmp_path_factory):
+    path = tmp_path_factory.mktemp(scale) / f"{scale}.txt"
+    generate_probe_file(str(path), SCALES[scale], *LOOP, gap_rate=1e-4, seed=0)
+    return str(path)
+
+
+@pytest.fixture(scope="session")
+def experiment(probe_file, tmp_path_factory):
+    """Experiment of the probe file, parsed without touching the app parsed files cache."""
+    from scripts import converter
+    from scripts.file_cache import ParsedCache
+
+    folder = str(tmp_path_factory.mktemp("parsed_files"))
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(converter, "ParsedCache", lambda: ParsedCache(folder))
+        experiment = converter.ExperimentCycle(*LOOP, probe_file, save_converted=False)
+    return experiment
@@ -0,0 +1,112 @@
+"""Time each stage of the conversion pipeline on its own."""
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from scripts.archive import ArchiveSink  # noqa
+from scripts.converter import OverviewPlot, Plot  # noqa
+from scripts.parser import read_probe_file  # noqa
+from scripts.segmentation import LoopIndex  # noqa
+from scripts.stats import ResumeDataFrame  # noqa
+from scripts.utils import to_datetime_column  # noqa
+
+PLOT_LOOPS = 24  # Loop plots drawn per round, plotting time grows linearly with the loops
+
+
+def run(benchmark, rounds, fn, *args, setup=None):
+    return benchmark.pedantic(fn, args, setup=setup, rounds=rounds, iterations=1)
+
+
+@pytest.fixture(scope="session")
+def raw(probe_file, dt_col):
+    return read_probe_file(probe_file, dt_col)
+
+
+@pytest.fixture(scope="session")
+def resume(experiment):
+    resume = ResumeDataFrame(experiment)
+    resume.generate_resume(0)
+    return resume
+
+
+@pytest.fixture(scope="session")
+def results_folder(resume, probe_file, tmp_path_factory):
+    """Folder with the raw recording and its results workbook, as left to be zipped."""
+    folder = tmp_path_factory.mktemp("results")
+    (folder / "data.txt").write_bytes(open(probe_file, "rb").read())
+    resume.save_workbook(str(folder / "data.xlsx"))
+    resume.save_loops_workbook(str(folder / "data_loops.xlsx"))
+    return str(folder)
+
+
+def test_parse(benchmark, rounds, probe_file, dt_col):
+    df = run(benchmark, rounds, read_probe_file, probe_file, dt_col)
+    assert df.columns[0] == dt_col
+
+
+def test_datetime(benchmark, rounds, raw, dt_col):
+    times = run(benchmark, rounds, to_datetime_column, raw[dt_col])
+    assert times.dtype.kind == "M"
+
+
+def test_segmentation(benchmark, rounds, experiment, loop):
+    times = experiment.df[experiment.dt_col_name].values
+    index = run(benchmark, rounds, LoopIndex, times, *loop)
+    assert len(index) == len(experiment.loop_index)
+
+
+def test_regression(benchmark, rounds, experiment):
+    experiment.loop_index  # Only the fits are timed
+
+    def fits():
+        return experiment.fits
+
+    def reset():
+        experiment.__dict__.pop("fits", None)
+
+    fit = run(benchmark, rounds, fits, setup=reset)
+    assert (fit.b < 0).all()
+
+
+def test_resume(benchmark, rounds, experiment):
+    def generate():
+        resume = ResumeDataFrame(experiment)
+        resume.generate_resume(0)
+        return resume
+
+    resume = run(benchmark, rounds, generate)
+    assert len(resume.resume_df) == len(experiment.loop_index)
+
+
+def test_plotting(benchmark, rounds, experiment, tmp_path):
+    def plot():
+        with ArchiveSink(str(tmp_path / "plots.zip")) as sink:
+            OverviewPlot(experiment, sink=sink).create()
+            for i, df_close in enumerate(experiment.df_close_list[:PLOT_LOOPS]):
+                Plot(
+                    df_close,
+                    experiment.x,
+                    experiment.y,
+                    experiment.plot_title,
+                    fname=f"df_plot_{i + 1}",
+                    fit=experiment.fit(i),
+                    sink=sink,
+                ).create()
+
+    run(benchmark, rounds, plot)
+
+
+def test_excel_export(benchmark, rounds, resume, tmp_path):
+    def export():
+        resume.save_workbook(str(tmp_path / "resume.xlsx"))
+        resume.save_loops_workbook(str(tmp_path / "loops.xlsx"))
+
+    run(benchmark, rounds, export)
+
+
+def test_zipping(benchmark, rounds, results_folder, tmp_path):
+    def zip_results():
+        with ArchiveSink(str(tmp_path / "results.zip")) as sink:
+            sink.add_folder(results_folder)
+
+    run(benchmark, rounds, zip_results)
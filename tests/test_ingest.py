@@ -0,0 +1,129 @@
+"""Probe files parsed from the upload chunks."""
+import hashlib
+import os
+from functools import partial
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from scripts import file_cache, ingest
+from scripts.file_cache import ParsedCache
+from scripts.generator import COLUMNS, generate_probe_file
+from scripts.ingest import IngestStream, ProbeStreamParser
+from scripts.parser import read_probe_file
+from scripts.utils import to_datetime_column
+
+DT_COL = COLUMNS[0]
+
+
+@pytest.fixture(scope="module")
+def probe_file(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("probe") / "data.txt")
+    generate_probe_file(path, 3600, gap_rate=0.01, seed=0)
+    return path
+
+
+@pytest.fixture(autouse=True)
+def hashes_folder(tmp_path, monkeypatch):
+    """Keep the hashes of the uploaded files out of the app folder."""
+    folder = str(tmp_path / "hashes")
+    monkeypatch.setattr(file_cache, "HASHES_FOLDER", folder)
+    monkeypatch.setattr(ingest, "remember_hash", partial(file_cache.remember_hash, folder=folder))
+    return folder
+
+
+def expected(path):
+    df = read_probe_file(path, DT_COL)
+    df[DT_COL] = to_datetime_column(df[DT_COL])
+    return df
+
+
+def chunks(raw, sizes):
+    """Split the raw bytes in chunks of the given sizes, cycling through them."""
+    start, i = 0, 0
+    while start < len(raw):
+        end = start + sizes[i % len(sizes)]
+        yield raw[start:end]
+        start, i = end, i + 1
+
+
+def random_sizes(seed, high):
+    return list(np.random.default_rng(seed).integers(1, high, 1000))
+
+
+@pytest.mark.parametrize("sizes", [[7], [1000, 3], random_sizes(0, 300), [1 << 20]])
+def test_stream_matches_file(probe_file, sizes):
+    with open(probe_file, "rb") as f:
+        raw = f.read()
+    # Small blocks so records are parsed in many blocks, split at any place of the chunks
+    parser = ProbeStreamParser(DT_COL, block_size=4096)
+    for chunk in chunks(raw, sizes):
+        parser.feed(chunk)
+    df = parser.close()
+    assert parser.parse_error is None
+    pd.testing.assert_frame_equal(df, expected(probe_file))
+
+
+def test_stream_without_final_newline(probe_file):
+    with open(probe_file, "rb") as f:
+        raw = f.read().rstrip(b"\r\n")
+    parser = ProbeStreamParser(DT_COL, block_size=4096)
+    for chunk in chunks(raw, [500]):
+        parser.feed(chunk)
+    pd.testing.assert_frame_equal(parser.close(), expected(probe_file))
+
+
+def upload(probe_file, folder, raw=None, **kwargs):
+    """Write a file to an ingest stream in chunks, as the upload does."""
+    if raw is None:
+        with open(probe_file, "rb") as f:
+            raw = f.read()
+    stream = IngestStream(str(folder / "uploads"), DT_COL, **kwargs)
+    for chunk in chunks(raw, [256]):
+        assert stream.write(chunk) == len(chunk)
+    dst = str(folder / "data.txt")
+    stream.save(dst)
+    return stream, dst
+
+
+def test_upload_is_cached(probe_file, tmp_path):
+    cache = ParsedCache(str(tmp_path / "cache"))
+    stream, dst = upload(probe_file, tmp_path, cache=cache)
+    assert stream.errors is None
+    with open(probe_file, "rb") as src, open(dst, "rb") as saved:
+        raw = src.read()
+        assert raw == saved.read()
+    digest = hashlib.blake2b(raw, digest_size=20).hexdigest()
+    assert file_cache.file_hash(dst) == digest  # Remembered while uploading
+    df = cache.get(cache.key(digest, DT_COL))
+    pd.testing.assert_frame_equal(df, expected(probe_file), check_dtype=False)
+
+
+def test_failed_check_stops_writing(probe_file, tmp_path):
+    cache = ParsedCache(str(tmp_path / "cache"))
+    columns = []
+
+    def check(found):
+        columns.append(found)
+        return ["Unexpected columns"]
+
+    stream, dst = upload(probe_file, tmp_path, check=check, cache=cache)
+    assert columns == [COLUMNS]
+    assert stream.errors == ["Unexpected columns"]
+    # Writing stops with the chunk that has the header line
+    assert 0 < os.path.getsize(dst) < 2048
+    assert not os.path.exists(cache.folder)
+
+
+def test_garbage_row_is_not_cached(probe_file, tmp_path):
+    with open(probe_file, "rb") as f:
+        lines = f.read().split(b"\n")
+    lines.insert(len(lines) // 2, b"garbage\trow\tx\ty\tz\tw\r")
+    cache = ParsedCache(str(tmp_path / "cache"))
+    stream, dst = upload(probe_file, tmp_path, raw=b"\n".join(lines), cache=cache)
+    # The headers are fine, the file is saved whole and parsed again by whoever reads it
+    assert stream.errors is None
+    assert stream.parser.parse_error
+    assert os.path.getsize(dst) == len(b"\n".join(lines))
+    assert not os.path.exists(cache.folder)
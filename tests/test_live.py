@@ -0,0 +1,91 @@
+"""Live analysis of a growing probe file against the resume of the complete file."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from scripts import converter
+from scripts.file_cache import ParsedCache
+from scripts.generator import generate_probe_file
+from scripts.live import LiveExperiment
+from scripts.stats import COLS_NAME, ResumeDataFrame
+
+LOOP = (3, 2, 20)  # flush, wait, close minutes
+SECONDS = 6 * 3600 + 600  # The last loop is still on its close phase
+
+
+@pytest.fixture(scope="module")
+def probe_file(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("probe") / "data.txt")
+    generate_probe_file(path, SECONDS, *LOOP, gap_rate=0.01, seed=0)
+    return path
+
+
+@pytest.fixture(scope="module")
+def resume(probe_file, tmp_path_factory):
+    """Resume of the complete file, parsed without touching the app parsed files cache."""
+    folder = str(tmp_path_factory.mktemp("parsed_files"))
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(converter, "ParsedCache", lambda: ParsedCache(folder))
+        experiment = converter.ExperimentCycle(*LOOP, probe_file, save_converted=False)
+    resume = ResumeDataFrame(experiment)
+    resume.generate_resume(0)
+    return resume.resume_df
+
+
+def grow(src, dst, seed, max_chunk=50000):
+    """Copy src to dst in random pieces, yielding after each one is written."""
+    with open(src, "rb") as f:
+        raw = f.read()
+    rng = np.random.default_rng(seed)
+    start = 0
+    with open(dst, "wb") as f:
+        while start < len(raw):
+            end = start + int(rng.integers(1, max_chunk))
+            f.write(raw[start:end])
+            f.flush()
+            start = end
+            yield
+
+
+def check_loops(loops, resume):
+    """Live loops are the resume loops, but the last one, whose close phase isn't over."""
+    assert len(loops) == len(resume) - 1
+    live = pd.DataFrame(loops, columns=COLS_NAME)
+    expected = resume.iloc[:-1].reset_index(drop=True)
+    dates = pd.to_datetime(live[COLS_NAME[0]], format="%d-%m-%Y %H:%M:%S")
+    assert dates.tolist() == pd.to_datetime(expected[COLS_NAME[0]]).tolist()
+    assert live["Loop"].tolist() == expected["Loop"].tolist()
+    assert live["Phase time [s]"].tolist() == expected["Phase time [s]"].tolist()
+    numeric = [name for name in COLS_NAME if name not in (COLS_NAME[0], "Loop", "Phase time [s]")]
+    assert np.allclose(live[numeric].astype(float), expected[numeric].astype(float))
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_growing_file_matches_resume(probe_file, resume, tmp_path, seed):
+    path = str(tmp_path / "live.txt")
+    results = []
+    experiment = None
+    for _ in grow(probe_file, path, seed):
+        if experiment is None:
+            experiment = LiveExperiment(path, *LOOP, on_loop=results.append)
+        experiment.read()
+    check_loops(experiment.loops, resume)
+    assert results == experiment.loops
+
+
+def test_replaced_file_is_read_again(probe_file, resume, tmp_path):
+    path = tmp_path / "live.txt"
+    path.write_bytes(open(probe_file, "rb").read()[:200000])
+    experiment = LiveExperiment(str(path), *LOOP)
+    experiment.read()
+    path.write_bytes(b"")
+    for _ in grow(probe_file, str(path), 2, max_chunk=500000):
+        experiment.read()
+    check_loops(experiment.loops, resume)
+
+
+def test_blank_is_subtracted(probe_file, tmp_path):
+    experiment = LiveExperiment(probe_file, *LOOP, blank=0.25)
+    experiment.read()
+    for loop in experiment.loops:
+        assert loop["O2 after blank"] == pytest.approx(loop["CH 1 MO2 [mgO2/hr]"] - 0.25)
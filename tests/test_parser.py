@@ -0,0 +1,81 @@
+"""Probe file parser."""
+import codecs
+import io
+
+import pandas as pd
+import pytest
+
+from scripts.generator import COLUMNS, PREAMBLE, generate_probe_file
+from scripts.parser import MAX_PREAMBLE_LINES, parse_records, read_header, read_probe_file
+
+DT_COL = COLUMNS[0]
+RECORDS = [
+    "02/03/2020 10:00:00\t0\t8,012\t15,031\t30,002\t5012\t",
+    "02/03/2020 10:00:01\t1\t8,004\t15,042\t29,981\t4987\t",
+    "02/03/2020 10:00:02\t2\t7,998\t15,018\t30,010\t5003\t",
+]
+
+
+def write_probe_file(path, preamble=PREAMBLE, records=RECORDS, encoding="latin-1", bom=False):
+    text = "\r\n".join(preamble + ["\t".join(COLUMNS) + "\t"] + records + [""])
+    raw = text.encode(encoding)
+    path.write_bytes(codecs.BOM_UTF8 + raw if bom else raw)
+    return str(path)
+
+
+def test_header_after_preamble(tmp_path):
+    header = read_header(write_probe_file(tmp_path / "data.txt"), DT_COL)
+    assert header.line == len(PREAMBLE)
+    assert header.columns == COLUMNS
+
+
+def test_header_with_bom(tmp_path):
+    path = write_probe_file(tmp_path / "data.txt", preamble=[], encoding="utf-8", bom=True)
+    header = read_header(path, DT_COL)
+    assert header.line == 0
+    assert header.encoding == "utf-8-sig"
+    assert read_probe_file(path, DT_COL).columns[0] == DT_COL
+
+
+def test_header_with_latin1_preamble(tmp_path):
+    preamble = ["Oxigen dissolt", "Ubicació\tcambra 1", ""]
+    path = write_probe_file(tmp_path / "data.txt", preamble=preamble)
+    header = read_header(path, DT_COL)
+    assert header.line == len(preamble)
+    assert header.columns[3] == COLUMNS[3]  # with the latin-1 degree sign
+
+
+def test_header_not_found(tmp_path):
+    preamble = ["instrument information"] * (MAX_PREAMBLE_LINES + 1)
+    path = write_probe_file(tmp_path / "data.txt", preamble=preamble)
+    with pytest.raises(ValueError, match="not found"):
+        read_header(path, DT_COL)
+
+
+def test_non_numeric_values(tmp_path):
+    records = RECORDS + ["02/03/2020 10:00:03\t3\t---\t15,020\t30,001\t4999\t"]
+    path = write_probe_file(tmp_path / "data.txt", records=records)
+    df = read_probe_file(path, DT_COL)
+    assert df[COLUMNS[2]].isna().tolist() == [False, False, False, True]
+    assert df[COLUMNS[3]].tolist() == [15.031, 15.042, 15.018, 15.02]
+    # Channels with integers only are floats too, as on the fast path
+    assert (df.dtypes[1:] == "float64").all()
+
+
+def test_records_from_stream(tmp_path):
+    path = write_probe_file(tmp_path / "data.txt")
+    header = read_header(path, DT_COL)
+    raw = "\r\n".join(RECORDS).encode("latin-1")
+    df = parse_records(io.BytesIO(raw), header)
+    assert df.equals(read_probe_file(path, DT_COL))
+
+
+def test_generated_file_types(tmp_path):
+    path = str(tmp_path / "data.txt")
+    rows = generate_probe_file(path, 3600, gap_rate=0.01, seed=0)
+    df = read_probe_file(path, DT_COL)
+    assert len(df) == rows
+    assert list(df.columns) == COLUMNS
+    assert pd.api.types.is_string_dtype(df[DT_COL])
+    assert (df.dtypes[1:] == "float64").all()
+    assert df[COLUMNS[2]].between(7, 9).all()
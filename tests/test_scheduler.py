@@ -0,0 +1,131 @@
+"""Pump program scheduler, on a fake clock."""
+import pytest
+
+from scripts.scheduler import PumpScheduler
+
+FLUSH, REST = 10.0, 90.0
+LOOP_TIME = FLUSH + REST
+
+
+class Clock:
+    """Monotonic clock that only moves when told to."""
+
+    def __init__(self, now=1000.0):  # noqa
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class Stop:
+    """Stop event whose waits move the clock, waking up `late` seconds after the timeout."""
+
+    def __init__(self, clock, late=0.0):  # noqa
+        self.clock = clock
+        self.late = late
+        self.stopped = False
+
+    def set(self):
+        self.stopped = True
+
+    def wait(self, timeout):
+        if not self.stopped:
+            self.clock.now += timeout + self.late
+        return self.stopped
+
+
+def schedule(loops, work=0.0, late=0.0, suspend=None):
+    """Run the scheduler until the given loops are done.
+
+    work: seconds each pump_cycle call takes.
+    suspend: (loop, seconds) the clock jumps once that loop pump is switched off.
+    Returns the scheduler and the (loop, on, time) of each pump_cycle call.
+    """
+    clock = Clock()
+    stop = Stop(clock, late)
+    scheduler = PumpScheduler(FLUSH, REST, stop, clock=clock)
+    calls = []
+
+    def pump_cycle(loop, on):
+        calls.append((loop, on, clock.now - scheduler.start))
+        clock.now += work
+        if suspend and not on and loop == suspend[0]:
+            clock.now += suspend[1]
+        if not on and loop >= loops:
+            stop.set()
+
+    scheduler.run(pump_cycle)
+    return scheduler, calls
+
+
+def test_slow_work_doesnt_shift_deadlines():
+    scheduler, calls = schedule(200, work=3.0)
+    assert len(calls) == 400
+    for loop, on, at in calls:
+        deadline = (loop - 1) * LOOP_TIME + (0 if on else FLUSH)
+        assert at == pytest.approx(deadline)
+    assert scheduler.skipped == 0
+
+
+def test_jitter():
+    scheduler, calls = schedule(5, late=0.02)
+    # The first loop starts right away, every later switch wakes up 20 ms late
+    for loop, on, at in calls[1:]:
+        deadline = (loop - 1) * LOOP_TIME + (0 if on else FLUSH)
+        assert at == pytest.approx(deadline + 0.02)  # Late wake ups don't add up
+    assert [t.loop for t in scheduler.timings] == [1, 2, 3, 4, 5]
+    assert scheduler.timings[0].on_jitter == 0
+    for t in scheduler.timings:
+        assert t.off_jitter == pytest.approx(0.02)
+    timing = scheduler.timing()
+    assert timing["loops"] == 5
+    assert timing["skipped"] == 0
+    assert timing["last_on_jitter"] == pytest.approx(20)
+    assert timing["mean_jitter"] == pytest.approx(20 * 9 / 10)
+    assert timing["max_jitter"] == pytest.approx(20)
+
+
+def test_missed_loops_are_skipped():
+    # Loop 3 ends at 210s and the clock jumps to 460s, past the flush of loops 4 and 5
+    scheduler, calls = schedule(7, suspend=(3, 250))
+    assert [loop for loop, on, at in calls if on] == [1, 2, 3, 6, 7]
+    assert calls[6] == (6, True, pytest.approx(5 * LOOP_TIME))
+    assert scheduler.skipped == 2
+    assert scheduler.timing()["skipped"] == 2
+
+
+def test_loop_on_its_flush_is_run_late():
+    # The clock jumps to 405s, half the flush of loop 5 is left
+    scheduler, calls = schedule(6, suspend=(3, 195))
+    assert [loop for loop, on, at in calls if on] == [1, 2, 3, 5, 6]
+    assert calls[6] == (5, True, pytest.approx(405))
+    assert calls[7] == (5, False, pytest.approx(410))
+    assert scheduler.timings[3].on_jitter == pytest.approx(5)
+    assert scheduler.skipped == 1
+
+
+def test_stop_during_flush_switches_off():
+    clock = Clock()
+    stop = Stop(clock)
+    scheduler = PumpScheduler(FLUSH, REST, stop, clock=clock)
+    calls = []
+
+    def pump_cycle(loop, on):
+        calls.append((loop, on))
+        if on and loop == 2:
+            stop.set()
+
+    scheduler.run(pump_cycle)
+    assert calls == [(1, True), (1, False), (2, True), (2, False)]
+    assert len(scheduler.timings) == 1
+
+
+def test_stop_before_start():
+    clock = Clock()
+    stop = Stop(clock)
+    stop.set()
+    scheduler = PumpScheduler(FLUSH, REST, stop, clock=clock)
+    calls = []
+    scheduler.run(lambda loop, on: calls.append((loop, on)))
+    # The first loop is due at once
+    assert calls == [(1, True), (1, False)]
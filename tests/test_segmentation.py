@@ -0,0 +1,77 @@
+"""Experiment loops segmentation from the records timestamps."""
+import numpy as np
+
+from scripts.segmentation import LoopIndex
+
+START = np.datetime64("2020-03-02T10:00:00", "ns")
+FLUSH, WAIT, CLOSE = 3, 2, 20
+LOOP = np.timedelta64((FLUSH + WAIT + CLOSE) * 60, "s")
+
+
+def records(seconds, drop=()):
+    """1 Hz record times, without the records in the dropped (start, end) seconds ranges."""
+    secs = np.arange(seconds)
+    keep = np.ones(seconds, dtype=bool)
+    for start, end in drop:
+        keep[start:end] = False
+    return START + secs[keep].astype("timedelta64[s]")
+
+
+def check_slices(index, times):
+    """Every close slice has all the records within its loop close phase, and only them."""
+    for (start, end), rows in zip(index.bounds[:, 2:], index.slices("close")):
+        inside = (times >= start) & (times < end)
+        assert np.array_equal(np.flatnonzero(inside), np.arange(len(times))[rows])
+
+
+def test_loops_start_on_schedule():
+    times = records(4 * 25 * 60)
+    index = LoopIndex(times, FLUSH, WAIT, CLOSE)
+    assert list(index.loops) == [1, 2, 3, 4]
+    assert (index.bounds[:, 0] == START + np.arange(4) * LOOP).all()
+    assert (index.rows[:, 3] - index.rows[:, 2] == CLOSE * 60).all()
+    check_slices(index, times)
+
+
+def test_gaps_dont_shift_loops():
+    # A 10 minutes gap on the close phase of loop 1 and a short one on the flush of loop 3
+    times = records(4 * 25 * 60, drop=[(600, 1200), (3010, 3070)])
+    index = LoopIndex(times, FLUSH, WAIT, CLOSE)
+    assert list(index.loops) == [1, 2, 3, 4]
+    assert (index.bounds[:, 0] == START + np.arange(4) * LOOP).all()
+    assert index.rows[0, 3] - index.rows[0, 2] == CLOSE * 60 - 600
+    check_slices(index, times)
+
+
+def test_multi_day_recording():
+    seconds = 3 * 24 * 3600
+    times = records(seconds, drop=[(86000, 87000), (200000, 200005)])
+    index = LoopIndex(times, FLUSH, WAIT, CLOSE)
+    total = -(-seconds // (25 * 60))  # the last loop is incomplete
+    assert list(index.loops) == list(range(1, total + 1))
+    assert index.bounds[-1, 0] == START + (total - 1) * LOOP
+    check_slices(index, times)
+
+
+def test_loops_without_close_data_are_left_out():
+    # Loop 2 keeps a single close record, and the recording ends before the close of loop 4
+    close_2 = 25 * 60 + (FLUSH + WAIT) * 60
+    times = records(3 * 25 * 60 + 4 * 60, drop=[(close_2 + 1, 2 * 25 * 60)])
+    index = LoopIndex(times, FLUSH, WAIT, CLOSE)
+    assert list(index.loops) == [1, 3]
+    assert set(index.ranges()) == {1, 3}
+    check_slices(index, times)
+
+
+def test_members_match_slices():
+    times = records(5 * 25 * 60, drop=[(700, 900), (4000, 4300)])
+    index = LoopIndex(times, FLUSH, WAIT, CLOSE)
+    labels, rows = index.members("close")
+    for i, rows_slice in enumerate(index.slices("close")):
+        assert np.array_equal(rows[labels == i], np.arange(len(times))[rows_slice])
+
+
+def test_empty_recording():
+    index = LoopIndex(records(0), FLUSH, WAIT, CLOSE)
+    assert len(index) == 0
+    assert index.slices("close") == []
@@ -0,0 +1,50 @@
+"""Loops trendlines fitted at once against a fit per loop with statsmodels."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from scripts.stats import trendline_data, trendlines
+
+sm = pytest.importorskip("statsmodels.api")
+
+
+def ols(x, y):
+    fit = sm.OLS(y, sm.add_constant(x)).fit()
+    return fit.rsquared, fit.params[0], fit.params[1]
+
+
+def loops_data(seed=0):
+    """Close phase like data of loops with different lengths, slopes and levels."""
+    rng = np.random.default_rng(seed)
+    lengths = rng.integers(2, 1200, 30)
+    labels = np.repeat(np.arange(len(lengths)), lengths)
+    x = np.concatenate([np.arange(n) / 60 for n in lengths])  # minutes since close start
+    slopes = rng.uniform(-0.05, -0.001, len(lengths))
+    levels = rng.uniform(5, 9, len(lengths))
+    y = levels[labels] + slopes[labels] * x + rng.normal(0, 0.01, len(x))
+    return x, y, labels
+
+
+def test_trendlines_match_statsmodels():
+    x, y, labels = loops_data()
+    fits = trendlines(x, y, labels)
+    for i in range(labels.max() + 1):
+        expected = ols(x[labels == i], y[labels == i])
+        assert np.allclose([fits.rsquared[i], fits.a[i], fits.b[i]], expected, atol=1e-9)
+
+
+def test_trendlines_far_from_zero():
+    # Time stamp codes of a long recording are big numbers, centered sums keep precision
+    x, y, labels = loops_data(1)
+    x = x + 1e6
+    fits = trendlines(x, y, labels)
+    for i in range(labels.max() + 1):
+        expected = ols(x[labels == i], y[labels == i])
+        assert np.allclose([fits.rsquared[i], fits.b[i]], [expected[0], expected[2]])
+
+
+def test_trendline_of_single_loop():
+    x, y, labels = loops_data(2)
+    rows = labels == 0
+    df = pd.DataFrame({"x": x[rows], "y": y[rows]})
+    assert np.allclose(trendline_data(df, "x", "y"), ols(x[rows], y[rows]))